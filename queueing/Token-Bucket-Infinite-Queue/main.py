@@ -1,6 +1,6 @@
 '''
 Simulates a token bucket traffic shaper w/ infinite queue (i.e. packets are never dropped).
-Note: In this version of the algorithm, each token = 1 packet.
+Note: In this version of the algorithm, each token = 1 packet (or 1 byte, with byteMode).
 
 Click the "run" button up top to run the simulation. The output plots
 will appear in the list of files on the left.
@@ -10,6 +10,9 @@ Input parameters (see INPUT PARAMS below):
     - Long term average arrival rate of packets (per second)
     - Token generation rate of the token bucket algorithm (per second)
     - Bucket size of token bucket algorithm
+    - Optionally (byteMode), the packet length mix or a trace of packet lengths
+    - Optionally (engine), the exact integer-time GCRA engine instead of the
+      float one
 
 Output plots:
     - Arrival vs departure empirical envelopes
@@ -24,67 +27,125 @@ numPackets = 1000 # Integer number
 arrRate = 350 # Packet arrival rate
 tokenRate = 350 # Token generation rate
 bucketSize = 5 # Max tokens in bucket
+numReplications = 1 # Set > 1 to run that many independent replications at once & print confidence intervals
+byteMode = False # Set True to count bytes: each token = 1 byte (tokenRate in bytes/s, bucketSize in bytes >= longest packet)
+packetLengths = [40, 1500] # Byte mode: packet lengths (Bytes) of the two packet types
+packetDistribution = [0.25, 0.75] # Byte mode: proportion of packets of each type
+packetLengthTrace = None # Byte mode: or, path to a text file of packet lengths (Bytes, one per line)
+engine = 'float' # Single runs: set 'gcra' for the exact integer-nanosecond engine (see queueing/gcra.py), checked against 'float'
+seed = None # Integer seed for a reproducible run (random if None)
+metricsOnly = False # Set True to skip all figures & print the statistics as JSON (matplotlib is never imported)
 ##### END INPUT PARAMS #####
 
 # Library imports
+import os
 import sys
-from random import expovariate
 import numpy as np
 
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
+if not metricsOnly:
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+# Shared engines live in the queueing package at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from queueing.simulate import simulateTokenBucket, packetLengthSamples
+from queueing.replications import replicateShaper, summarize, printSummary
+from queueing.rng import seedSequence, spawnGenerators, exponential
+from queueing.occupancy import backlogSeries, occupancyDistribution, littlesLaw
+from queueing.ecdf import ecdf
+from queueing.metrics import sampleMetrics, systemMetrics, summaryMetrics, printMetrics
+
+if metricsOnly:
+    # Progress messages go to stderr, leaving stdout for the JSON document
+    metricsOut, sys.stdout = sys.stdout, sys.stderr
 
 print("Simulating %s packets arriving at avg. rate %s" % (numPackets, arrRate))
 print("Token generation rate of %s and max bucket size of %s" % (tokenRate, bucketSize))
 
-# Initialize figure
-fig = plt.figure(figsize=(10, 8))
-ax = fig.add_subplot(111)
+# Random streams for arrivals & packet lengths (byte mode), derived from a single seed (see queueing/rng.py)
+seedSeq = seedSequence(seed)
+arrGen, lenGen = spawnGenerators(seedSeq)
+print("Random seed = %s" % seedSeq.entropy)
+
+# Byte mode: packets need as many tokens as their length, from a trace (used in order,
+# repeated if shorter than numPackets) or drawn from the packetLengths mix
+lengthArgs, sampleLengths = {}, None
+if byteMode and packetLengthTrace is not None:
+    traceLengths = np.loadtxt(packetLengthTrace, ndmin=1)
+    print("Byte mode: packet lengths from %s (%s packets)" % (packetLengthTrace, len(traceLengths)))
+    lengthArgs = {'pktLengths': traceLengths}
+    sampleLengths = lambda r, n: np.resize(traceLengths, n)
+    longestPacket = traceLengths[:numPackets].max()
+elif byteMode:
+    print("Byte mode: %s%% of packets with length %s Bytes, %s%% with length %s Bytes"
+          % (packetDistribution[0] * 100, packetLengths[0], packetDistribution[1] * 100, packetLengths[1]))
+    lengthArgs = {'packetLengths': packetLengths, 'packetDistribution': packetDistribution}
+    sampleLengths = lambda r, n: packetLengthSamples(lenGen, packetLengths, packetDistribution, (r, n))
+    longestPacket = max(packetLengths)
+
+# A packet longer than the bucket could never collect enough tokens to leave
+if byteMode and bucketSize < longestPacket:
+    sys.exit("Byte mode: bucketSize is in Bytes and must be at least the longest packet (%s Bytes), got %s"
+             % (longestPacket, bucketSize))
+
+if numReplications > 1:
+    # Replication mode: simulate all replications as one (numReplications x numPackets) block; no plots
+    print("\nRunning %s replications" % numReplications)
+    stats = replicateShaper(lambda r, n: exponential(arrGen, arrRate, (r, n)),
+                            tokenRate, bucketSize, numReplications, numPackets, sampleLengths=sampleLengths)
+    summary = summarize(stats)
+    printSummary(summary)
+    if metricsOnly:
+        printMetrics({'numReplications': numReplications, 'numPackets': numPackets,
+                      'seed': seedSeq.entropy, 'replications': summaryMetrics(summary)}, metricsOut)
+    sys.exit(0)
 
-interArrivals = [expovariate(arrRate) for i in range(numPackets)]
-arrEmpEnv = np.cumsum(interArrivals)
-departEmpEnv = [0] * numPackets
+# Initialize figure
+if not metricsOnly:
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
 
 # Assume bucket was initially full
 # Assume first packet was immediately transmitted upon arrival
-departEmpEnv[0] = arrEmpEnv[0]
-numTokens = bucketSize - 1
-waitCount = 0
-
-for i in range(1, numPackets):
-    currTime = arrEmpEnv[i]
-    dt = currTime - departEmpEnv[i - 1]
-
-    numTokens = min(numTokens + tokenRate * dt, bucketSize)
-
-    if numTokens >= 1:
-        # Can transmit packets
-        numTokens -= 1
-        departEmpEnv[i] = currTime
-    else:
-        # No available token
-        # Calculate time required to wait until we have 1 token
-        dt = (1 - numTokens) / tokenRate
-        departEmpEnv[i] = currTime + dt
-        numTokens = 0
+# Departures are the min-plus convolution of arrivals w/ the token bucket curve
+# (see queueing/tokenbucket.py and queueing/simulate.py)
+interArrivals, arrEmpEnv, departEmpEnv, pktLengths = simulateTokenBucket(
+    numPackets, arrRate, tokenRate, bucketSize, seedSeq.entropy, engine=engine, **lengthArgs)
+
+if engine == 'gcra':
+    # Cross-check against the float engine on the same packets; departures only differ
+    # by the rounding of times & token rate to the nanosecond (see queueing/gcra.py)
+    floatDepartures = simulateTokenBucket(numPackets, arrRate, tokenRate, bucketSize,
+                                          seedSeq.entropy, **lengthArgs).departEmpEnv
+    engineMaxDiff = np.max(np.abs(departEmpEnv - floatDepartures))
+    print("GCRA vs float engine: max departure time difference = %s s" % engineMaxDiff)
 
 # Calculate inter-departure times
-interDepartures = [0] * numPackets
-for i in range(1, numPackets):
-    interDepartures[i] = departEmpEnv[i] - departEmpEnv[i - 1]
+interDepartures = np.zeros(numPackets)
+interDepartures[1:] = np.diff(departEmpEnv)
+
+if metricsOnly:
+    # Headless mode: summary statistics only, no figures
+    printMetrics({'numPackets': numPackets, 'arrRate': arrRate, 'tokenRate': tokenRate,
+                  'bucketSize': bucketSize, 'seed': seedSeq.entropy, 'byteMode': byteMode,
+                  'engine': engine, 'engineMaxDiff': engineMaxDiff if engine == 'gcra' else None,
+                  'meanPacketLength': None if pktLengths is None else pktLengths.mean(),
+                  'delay': sampleMetrics(departEmpEnv - arrEmpEnv),
+                  'interArrival': sampleMetrics(interArrivals),
+                  'interDeparture': sampleMetrics(interDepartures[1:]),
+                  'system': systemMetrics(arrEmpEnv, departEmpEnv)}, metricsOut)
+    sys.exit(0)
 
 print("\nPlotting figures ... please wait")
 
 # Plot inter-packet time CDFs
-# NOTE: Using matplotlib's histogram to generate CDF results in last point y = 0
-#       Hacky workaround is to delete the last point: ret[2][0].set_xy(ret[2][0].get_xy()[:-1])
-numBins = 10000 if numPackets > 10000 else numPackets
-ret = ax.hist(interDepartures, numBins, density=True, cumulative=True, histtype='step', label="Inter-Departure Times", linewidth=2.0)
-ret[2][0].set_xy(ret[2][0].get_xy()[:-1]) # Hack (see above)
+# Exact empirical CDFs (sorted once, reduced to ~1 point per pixel with the upper tail kept exact)
+x, F = ecdf(interDepartures)
+ax.plot(x, F, label="Inter-Departure Times", drawstyle='steps-post', linewidth=2.0)
 
-ret = ax.hist(interArrivals, numBins, density=True, cumulative=True, histtype='step', label="Inter-Arrival Times", linewidth=2.0)
-ret[2][0].set_xy(ret[2][0].get_xy()[:-1]) # Hack (see above)
+x, F = ecdf(interArrivals)
+ax.plot(x, F, label="Inter-Arrival Times", drawstyle='steps-post', linewidth=2.0)
 
 ax.legend(loc='right')
 plt.grid()
@@ -94,15 +155,16 @@ plt.title("Arrival vs Departure Inter-Packet Time CDF")
 fig.savefig('interpacket-cdf.png')
 
 
-# Plot empirical envelopes
+# Plot empirical envelopes (cumulative bytes in byte mode)
 fig = plt.figure(figsize=(10, 8))
 ax = fig.add_subplot(111)
-ax.plot(arrEmpEnv, range(numPackets), label="Arrivals", linewidth=2.0)
-ax.plot(departEmpEnv, range(numPackets), label="Departures", linewidth=2.0)
+envelope = range(numPackets) if pktLengths is None else np.cumsum(pktLengths)
+ax.plot(arrEmpEnv, envelope, label="Arrivals", linewidth=2.0)
+ax.plot(departEmpEnv, envelope, label="Departures", linewidth=2.0)
 ax.legend(loc='right')
 plt.grid()
 plt.xlabel("Time (s)")
-plt.ylabel("Packet Count")
+plt.ylabel("Packet Count" if pktLengths is None else "Bytes")
 plt.title("Arrival vs Departure Empirical Envelopes")
 
 fig.savefig('empirical-env.png')
@@ -110,31 +172,16 @@ fig.savefig('empirical-env.png')
 
 # Plot packets in system
 # Logically, PacketsInSystem(t) = ArrivalEmpEnv(t) - DepartureEmpEnv(t)
-# Split time into discrete number of intervals (max 10000) and calculate backlog for each
+# Split time into discrete number of intervals (max 10000) and calculate the exact backlog at each
 numPoints = 10000 if numPackets > 10000 else numPackets
-timeInterval = max(departEmpEnv) / numPoints
-pktInSys = [0] * numPoints
-arrIndex = 0
-departIndex = 0
-for i in range(numPoints):
-    intervalEnd = timeInterval * (i+1)
-
-    for arrIndex in range(arrIndex, numPackets):
-        if arrEmpEnv[arrIndex] > intervalEnd:
-            break;
-
-    for departIndex in range(departIndex, numPackets):
-        if departEmpEnv[departIndex] > intervalEnd:
-            break;
-
-    numArrivals = arrIndex - 1 if arrIndex > 0 else 0
-    numDepartures = departIndex - 1 if departIndex > 0 else 0
-    pktInSys[i] = numArrivals - numDepartures
+timeInterval = np.max(departEmpEnv) / numPoints
+gridTimes = np.arange(numPoints) * timeInterval
+pktInSys = backlogSeries(arrEmpEnv, departEmpEnv, gridTimes)
 
 fig = plt.figure(figsize=(10, 8))
 ax = fig.add_subplot(111)
-ax.plot([i * timeInterval for i in range(numPoints)], pktInSys,
-        label="Packets in System", drawstyle='steps', linewidth=2.0)
+ax.plot(gridTimes, pktInSys,
+        label="Packets in System", drawstyle='steps-post', linewidth=2.0)
 ax.legend(loc='right')
 plt.grid()
 plt.xlabel("Time (s)")
@@ -144,6 +191,26 @@ plt.title("Packets Waiting or being Processed vs Time")
 fig.savefig('pkts-in-system.png')
 
 
+# Exact time-weighted distribution of packets in system, from the merged arrival & departure events
+occupancyProbs, meanOccupancy = occupancyDistribution(arrEmpEnv, departEmpEnv)
+little = littlesLaw(arrEmpEnv, departEmpEnv, end=arrEmpEnv[-1]) # Window ends at the last arrival
+print("Mean packets in system = %s" % meanOccupancy)
+print("Little's law (until last arrival): L = %s; lambda * W = %s; gap = %s"
+        % (little['L'], little['lambda'] * little['W'], little['gap']))
+
+fig = plt.figure(figsize=(10, 8))
+ax = fig.add_subplot(111)
+numInSystem = np.arange(len(occupancyProbs))
+ax.bar(numInSystem, occupancyProbs, label="Empirical (time-weighted)")
+ax.legend(loc='right')
+plt.grid()
+plt.xlabel("Packets in System")
+plt.ylabel("Probability")
+plt.title("Time-Weighted Distribution of Packets in System")
+
+fig.savefig('occupancy-distribution.png')
+
+
 # Plot per-packet wait time
 # For each packet, it's just departure time - arrival time
 # Bar plots get exponentially slow when number of points is large (over ~1000), so let's switch to "fill"
@@ -1,7 +1,7 @@
 '''
 Simulates a token bucket traffic shaper w/ no queue (i.e. packets
 are dropped if no token is available).
-Note: In this version of the algorithm, each token = 1 packet.
+Note: In this version of the algorithm, each token = 1 packet (or 1 byte, with byteMode).
 
 Click the "run" button up top to run the simulation.
 
@@ -10,9 +10,19 @@ Input parameters (see INPUT PARAMS below):
     - Long term average arrival rate of packets (per second)
     - Token generation rate of the token bucket algorithm (per second)
     - Bucket size of token bucket algorithm
+    - Optionally (byteMode), the packet length mix or a trace of packet lengths
+    - Optionally (numFlows), the number of flows sharing the stream, each
+      policed by its own bucket
+    - Optionally (engine), the exact integer-time GCRA engine instead of the
+      float one
 
 Output:
     - Simply prints the number of packets dropped by the system
+      (or, with metricsOnly, a JSON document of statistics)
+    - With gridTokenRates & gridBucketSizes set: the drop-rate surface over
+      every (tokenRate, bucketSize) pair, plotted as a contour map
+    - With numFlows set: the drops of each flow, plotted against the number
+      of packets the flow sent
 
 Author: Thomas Lin (t.lin@mail.utoronto.ca) 2018
 '''
@@ -21,30 +31,169 @@ numPackets = 10000 # Integer number
 arrRate = 350 # Packet arrival rate
 tokenRate = 350 # Token generation rate
 bucketSize = 2 # Max tokens in bucket
+numReplications = 1 # Set > 1 to run that many independent replications at once & print confidence intervals
+byteMode = False # Set True to count bytes: each token = 1 byte (tokenRate in bytes/s, bucketSize in bytes)
+packetLengths = [40, 1500] # Byte mode: packet lengths (Bytes) of the two packet types
+packetDistribution = [0.25, 0.75] # Byte mode: proportion of packets of each type
+packetLengthTrace = None # Byte mode: or, path to a text file of packet lengths (Bytes, one per line)
+gridTokenRates = None # List of token rates (e.g. [250, 275, ..., 450]) and
+gridBucketSizes = None # list of bucket sizes (e.g. [1, 2, ..., 100]): set both to compute the drop-rate surface
+numWorkers = 1 # Set > 1 to split the surface's (tokenRate, bucketSize) pairs across that many processes
+numFlows = None # Set to police each of that many flows w/ its own bucket (arrRate is then the total of all flows)
+flowZipfExponent = 0 # Per-flow mode: flow f sends a share ~ 1 / (f + 1)^exponent of the packets (0 = equal shares)
+engine = 'float' # Single runs: set 'gcra' for the exact integer-nanosecond engine (see queueing/gcra.py), checked against 'float'
+seed = None # Integer seed for a reproducible run (random if None)
+metricsOnly = False # Set True to print the statistics as JSON
 # END INPUT PARAMS
 
 # Library imports
-from random import expovariate
+import os
+import sys
+import numpy as np
+
+# Shared engines live in the queueing package at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from queueing.simulate import simulatePolicer, simulateFlowPolicer, packetLengthSamples
+from queueing.tokenbucket import policerDropSurface
+from queueing.replications import replicatePolicer, summarize, printSummary
+from queueing.rng import seedSequence, spawnGenerators, exponential
+from queueing.metrics import sampleMetrics, summaryMetrics, printMetrics
+
+if metricsOnly:
+    # Progress messages go to stderr, leaving stdout for the JSON document
+    metricsOut, sys.stdout = sys.stdout, sys.stderr
 
 print("Simulating %s packets arriving at avg. rate %s" % (numPackets, arrRate))
 print("Token generation rate of %s and max bucket size of %s" % (tokenRate, bucketSize))
 
-interArrivals = [expovariate(arrRate) for i in range(numPackets)]
+# Random streams for arrivals & packet lengths (byte mode), derived from a single seed (see queueing/rng.py)
+seedSeq = seedSequence(seed)
+arrGen, lenGen = spawnGenerators(seedSeq)
+print("Random seed = %s" % seedSeq.entropy)
+
+# Byte mode: packets need as many tokens as their length, from a trace (used in order,
+# repeated if shorter than numPackets) or drawn from the packetLengths mix
+lengthArgs, sampleLengths = {}, None
+if byteMode and packetLengthTrace is not None:
+    traceLengths = np.loadtxt(packetLengthTrace, ndmin=1)
+    print("Byte mode: packet lengths from %s (%s packets)" % (packetLengthTrace, len(traceLengths)))
+    lengthArgs = {'pktLengths': traceLengths}
+    sampleLengths = lambda r, n: np.resize(traceLengths, n)
+elif byteMode:
+    print("Byte mode: %s%% of packets with length %s Bytes, %s%% with length %s Bytes"
+          % (packetDistribution[0] * 100, packetLengths[0], packetDistribution[1] * 100, packetLengths[1]))
+    lengthArgs = {'packetLengths': packetLengths, 'packetDistribution': packetDistribution}
+    sampleLengths = lambda r, n: packetLengthSamples(lenGen, packetLengths, packetDistribution, (r, n))
+
+if numReplications > 1:
+    # Replication mode: simulate all replications as one (numReplications x numPackets) block; no plots
+    print("\nRunning %s replications" % numReplications)
+    stats = replicatePolicer(lambda r, n: exponential(arrGen, arrRate, (r, n)),
+                             tokenRate, bucketSize, numReplications, numPackets, sampleLengths=sampleLengths)
+    summary = summarize(stats)
+    printSummary(summary)
+    if metricsOnly:
+        printMetrics({'numReplications': numReplications, 'numPackets': numPackets,
+                      'seed': seedSeq.entropy, 'replications': summaryMetrics(summary)}, metricsOut)
+    sys.exit(0)
+
+if numFlows is not None:
+    # Per-flow mode: packets of numFlows flows interleaved in one stream, each flow w/ its own
+    # (tokenRate, bucketSize) bucket; generated & policed block by block (see queueing/flowpolicer.py)
+    print("\nPolicing %s flows (Zipf exponent %s), each w/ its own bucket" % (numFlows, flowZipfExponent))
+    packetCounts, dropCounts, byteCounts, droppedBytes = simulateFlowPolicer(
+        numPackets, arrRate, numFlows, tokenRate, bucketSize, seedSeq.entropy,
+        zipfExponent=flowZipfExponent, initialTokens=0, **lengthArgs)
+    active = packetCounts > 0
+    flowDropRates = dropCounts[active] / packetCounts[active].astype(float)
+
+    print("Number of packets dropped: %s" % dropCounts.sum())
+    print("Flows w/ drops: %s of %s" % (np.count_nonzero(dropCounts), np.count_nonzero(active)))
+    print("Drop rate per flow: mean %s, max %s" % (flowDropRates.mean(), flowDropRates.max()))
 
-numTokens = 0
-dropCount = 0
+    if metricsOnly:
+        metrics = {'numPackets': numPackets, 'arrRate': arrRate, 'numFlows': numFlows,
+                   'zipfExponent': flowZipfExponent, 'tokenRate': tokenRate, 'bucketSize': bucketSize,
+                   'seed': seedSeq.entropy, 'byteMode': byteMode, 'dropCount': dropCounts.sum(),
+                   'dropRate': dropCounts.sum() / float(numPackets),
+                   'flowsWithDrops': np.count_nonzero(dropCounts), 'flowDropRate': sampleMetrics(flowDropRates)}
+        if byteCounts is not None:
+            metrics['byteDropRate'] = droppedBytes.sum() / byteCounts.sum()
+        printMetrics(metrics, metricsOut)
+        sys.exit(0)
 
-for i in range(numPackets):
-    numTokens = min(numTokens + tokenRate * interArrivals[i], bucketSize)
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
+    ax.scatter(packetCounts[active], flowDropRates, s=4)
+    ax.set_xscale('log')
+    plt.grid()
+    plt.xlabel("Packets Sent by Flow")
+    plt.ylabel("Drop Rate of Flow")
+    plt.title("Per-Flow Drop Rates of %s Token Bucket Policers" % numFlows)
+    fig.savefig('per-flow-drop-rates.png')
+    print("Finished plotting all figures!")
+    sys.exit(0)
 
-    if numTokens >= 1:
-        # Can transmit packets
-        numTokens -= 1
-    else:
-        # No available token; Drop packet
-        dropCount += 1
+if gridTokenRates is not None and gridBucketSizes is not None:
+    # Surface mode: one shared arrival trace, every (tokenRate, bucketSize) pair simulated side by side
+    print("\nComputing drop rates for %s token rates x %s bucket sizes"
+          % (len(gridTokenRates), len(gridBucketSizes)))
+    interArrivals = exponential(arrGen, arrRate, numPackets)
+    pktLengths = None if sampleLengths is None else sampleLengths(1, numPackets).reshape(numPackets)
+    dropRates = policerDropSurface(interArrivals, gridTokenRates, gridBucketSizes, initialTokens=0,
+                                   numWorkers=numWorkers, pktLengths=pktLengths) / float(numPackets)
+
+    if metricsOnly:
+        printMetrics({'numPackets': numPackets, 'arrRate': arrRate, 'seed': seedSeq.entropy, 'byteMode': byteMode,
+                      'tokenRates': list(gridTokenRates), 'bucketSizes': list(gridBucketSizes),
+                      'dropRate': dropRates}, metricsOut)
+        sys.exit(0)
+
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
+    surface = ax.contourf(gridBucketSizes, gridTokenRates, dropRates, levels=20, cmap='viridis')
+    fig.colorbar(surface, ax=ax, label="Drop Rate")
+    levels = [level for level in (0.001, 0.01, 0.05, 0.1, 0.2) if dropRates.min() < level < dropRates.max()]
+    if levels:
+        lines = ax.contour(gridBucketSizes, gridTokenRates, dropRates, levels=levels, colors='white', linewidths=1.0)
+        ax.clabel(lines, fmt='%g')
+    plt.xlabel("Bucket Size (Bytes)" if byteMode else "Bucket Size (tokens)")
+    plt.ylabel("Token Generation Rate (Bytes per second)" if byteMode else "Token Generation Rate (per second)")
+    plt.title("Drop Rate of Token Bucket Policer (arrival rate %s)" % arrRate)
+    fig.savefig('drop-rate-surface.png')
+    print("Finished plotting all figures!")
+    sys.exit(0)
+
+# Bucket starts empty; each packet takes a token if one is available, otherwise it's dropped
+# (blocked scan over the packets, see queueing/tokenbucket.py and queueing/simulate.py)
+interArrivals, dropped, pktLengths = simulatePolicer(numPackets, arrRate, tokenRate, bucketSize,
+                                                     seedSeq.entropy, initialTokens=0, engine=engine, **lengthArgs)
+dropCount = np.count_nonzero(dropped)
 
 print()
 print("Number of packets dropped: %s" % dropCount)
+if pktLengths is not None:
+    byteDropRate = pktLengths[dropped].sum() / pktLengths.sum()
+    print("Fraction of bytes dropped: %s" % byteDropRate)
+
+if engine == 'gcra':
+    # Cross-check against the float engine on the same packets; decisions only differ
+    # where rounding to the nanosecond tips a packet over (see queueing/gcra.py)
+    floatDropped = simulatePolicer(numPackets, arrRate, tokenRate, bucketSize, seedSeq.entropy,
+                                   initialTokens=0, **lengthArgs).dropped
+    engineMismatches = np.count_nonzero(dropped != floatDropped)
+    print("GCRA vs float engine: %s of %s decisions differ" % (engineMismatches, numPackets))
+
+if metricsOnly:
+    metrics = {'numPackets': numPackets, 'arrRate': arrRate, 'tokenRate': tokenRate,
+               'bucketSize': bucketSize, 'seed': seedSeq.entropy, 'byteMode': byteMode, 'engine': engine,
+               'dropCount': dropCount, 'dropRate': dropCount / float(numPackets)}
+    if pktLengths is not None:
+        metrics['byteDropRate'] = byteDropRate
+    if engine == 'gcra':
+        metrics['engineMismatches'] = engineMismatches
+    printMetrics(metrics, metricsOut)
 
 
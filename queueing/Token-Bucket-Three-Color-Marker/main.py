@@ -0,0 +1,132 @@
+'''
+Simulates a three color marker (srTCM, RFC 2697, or trTCM, RFC 2698): two
+coupled token buckets mark each packet green, yellow or red instead of
+making a pass / drop decision. Packets that aren't red are then sent
+through a FIFO link, as they would be after the marker in a router.
+Note: In this version of the algorithm, each token = 1 packet (or 1 byte, with byteMode).
+
+Click the "run" button up top to run the simulation. The output plots
+will appear in the list of files on the left.
+
+Input parameters (see INPUT PARAMS below):
+    - Number of packets received by the marker
+    - Long term average arrival rate of packets (per second)
+    - Committed rate & burst size, plus the excess burst size (srTCM) or
+      the peak rate & burst size (trTCM)
+    - Service rate of the link after the marker
+    - Optionally (byteMode), the packet length mix or a trace of packet lengths
+
+Output:
+    - Prints the number & rate of packets of each color, and the mean wait
+      time of the packets that aren't red in the link's queue
+      (or, with metricsOnly, a JSON document of statistics)
+    - Plots the cumulative number of packets of each color vs time
+'''
+# INPUT PARAMS
+numPackets = 10000 # Integer number
+arrRate = 350 # Packet arrival rate
+cir = 300 # Committed information rate (tokens per second)
+cbs = 5 # Committed burst size (tokens)
+ebs = 10 # srTCM: excess burst size (tokens)
+pir = None # trTCM: set a peak information rate (>= cir) to use the two rate marker instead
+pbs = 10 # trTCM: peak burst size (tokens)
+linkRate = 400 # Service rate of the link after the marker (tokens per second)
+byteMode = False # Set True to count bytes: each token = 1 byte (rates in bytes/s, burst sizes in bytes)
+packetLengths = [40, 1500] # Byte mode: packet lengths (Bytes) of the two packet types
+packetDistribution = [0.25, 0.75] # Byte mode: proportion of packets of each type
+packetLengthTrace = None # Byte mode: or, path to a text file of packet lengths (Bytes, one per line)
+seed = None # Integer seed for a reproducible run (random if None)
+metricsOnly = False # Set True to skip all figures & print the statistics as JSON (matplotlib is never imported)
+# END INPUT PARAMS
+
+# Library imports
+import os
+import sys
+import numpy as np
+
+if not metricsOnly:
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+# Shared engines live in the queueing package at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from queueing.simulate import simulateMarker
+from queueing.marker import colorStats, colorInterArrivals, COLOR_NAMES, RED
+from queueing.lindley import lindley
+from queueing.rng import seedSequence
+from queueing.metrics import sampleMetrics, printMetrics
+
+if metricsOnly:
+    # Progress messages go to stderr, leaving stdout for the JSON document
+    metricsOut, sys.stdout = sys.stdout, sys.stderr
+
+markerName = "srTCM" if pir is None else "trTCM"
+print("Simulating %s packets arriving at avg. rate %s" % (numPackets, arrRate))
+if pir is None:
+    print("srTCM w/ committed rate %s, committed burst size %s and excess burst size %s" % (cir, cbs, ebs))
+else:
+    print("trTCM w/ committed rate %s & burst size %s, peak rate %s & burst size %s" % (cir, cbs, pir, pbs))
+
+# Random streams for arrivals & packet lengths (byte mode), derived from a single seed (see queueing/rng.py)
+seedSeq = seedSequence(seed)
+print("Random seed = %s" % seedSeq.entropy)
+
+# Byte mode: packets need as many tokens as their length, from a trace (used in order,
+# repeated if shorter than numPackets) or drawn from the packetLengths mix
+lengthArgs = {}
+if byteMode and packetLengthTrace is not None:
+    lengthArgs = {'pktLengths': np.loadtxt(packetLengthTrace, ndmin=1)}
+    print("Byte mode: packet lengths from %s (%s packets)" % (packetLengthTrace, len(lengthArgs['pktLengths'])))
+elif byteMode:
+    print("Byte mode: %s%% of packets with length %s Bytes, %s%% with length %s Bytes"
+          % (packetDistribution[0] * 100, packetLengths[0], packetDistribution[1] * 100, packetLengths[1]))
+    lengthArgs = {'packetLengths': packetLengths, 'packetDistribution': packetDistribution}
+
+# Both buckets start full; each packet is colored by the tokens left in them
+# (blocked scan over the packets, see queueing/marker.py and queueing/simulate.py)
+interArrivals, colors, pktLengths = simulateMarker(numPackets, arrRate, cir, cbs, ebs=ebs, pir=pir, pbs=pbs,
+                                                   seed=seedSeq.entropy, **lengthArgs)
+stats = colorStats(colors, interArrivals, pktLengths)
+
+print()
+for name in COLOR_NAMES:
+    print("%s packets: %s (%.2f%%), rate %s per second"
+          % (name.capitalize(), stats[name]['count'], stats[name]['fraction'] * 100, stats[name]['rate']))
+
+# Packets that aren't red join the link's queue; each one takes 1 / linkRate seconds
+# (or its length / linkRate in byte mode) to send
+keptInterArrivals = colorInterArrivals(interArrivals, colors)
+serviceTimes = 1.0 / linkRate if pktLengths is None else pktLengths[colors != RED] / float(linkRate)
+waitTimes = lindley(keptInterArrivals, serviceTimes)
+print("\nMean wait time of green & yellow packets in the link's queue: %s" % waitTimes.mean())
+
+if metricsOnly:
+    printMetrics({'numPackets': numPackets, 'arrRate': arrRate, 'marker': markerName,
+                  'cir': cir, 'cbs': cbs, 'ebs': ebs if pir is None else None,
+                  'pir': pir, 'pbs': pbs if pir is not None else None, 'linkRate': linkRate,
+                  'seed': seedSeq.entropy, 'byteMode': byteMode,
+                  'colors': stats, 'linkWait': sampleMetrics(waitTimes)}, metricsOut)
+    sys.exit(0)
+
+print("\nPlotting figures ... please wait")
+
+# Plot the cumulative number of packets of each color
+# i.e. the empirical envelope of each color's packet stream
+fig = plt.figure(figsize=(10, 8))
+ax = fig.add_subplot(111)
+arrEmpEnv = np.cumsum(interArrivals)
+lineColors = ['green', 'gold', 'red']
+for color, name in enumerate(COLOR_NAMES):
+    ax.plot(arrEmpEnv, np.cumsum(colors == color), label=name.capitalize(), color=lineColors[color],
+            drawstyle='steps-post', linewidth=2.0)
+ax.legend(loc='upper left')
+plt.grid()
+plt.xlabel("Time (s)")
+plt.ylabel("Packet Count")
+plt.title("Packets Marked by %s vs Time" % markerName)
+
+fig.savefig('color-envelopes.png')
+
+
+print("Finished plotting all figures!")
@@ -18,9 +18,10 @@ Input parameters (see INPUT PARAMS below):
     - System utilization (decimal number < 1)
 
 Output plots:
-    - Empirical CDF of M/G/1
+    - Comparison of empirical vs theoretical CDFs of M/G/1
     - Packets in system (waiting or being serviced) at a given time
     - Total wait time (waiting or being serviced) of each packet
+    - Goodness-of-fit scores vs theory (goodness-of-fit.json)
 
 Author: Thomas Lin (t.lin@mail.utoronto.ca) 2018
 '''
@@ -30,17 +31,42 @@ packetLengths = [40, 1500] # List of packet lengths
 packetDistribution = [0.25, 0.75] # Proportion of packets
 outgoingBW = 10**8 # Outgoing link bandwidth (bits per second)
 rho = 0.5 # System utilization
+chunkSize = None # Set (e.g. 10**6) to stream long runs in constant memory (CDF plot only)
+numWorkers = 1 # Set > 1 to split the Lindley run across that many processes
+counterRNG = False # Use counter-based (Philox) streams: same seed gives identical results for any numWorkers
+numReplications = 1 # Set > 1 to run that many independent replications at once & print confidence intervals
+sweepLoads = None # List of utilizations (e.g. [0.1, 0.3, 0.5, 0.7, 0.9]) to sweep instead of a single run
+seed = None # Integer seed for a reproducible run (random if None)
+metricsOnly = False # Set True to skip all figures & print the statistics as JSON (matplotlib is never imported)
 # END INPUT PARAMS
 
 # Library imports
+import os
 import sys
-from random import expovariate
-from numpy.random import binomial
+import json
 import numpy as np
 
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
+if not metricsOnly:
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+# Shared engines live in the queueing package at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from queueing.sweep import sweepLindley
+from queueing.streaming import streamLindley, WaitStats, WaitHistogram
+from queueing.replications import replicateLindley, summarize, printSummary
+from queueing.rng import seedSequence, spawnGenerators, exponential, bernoulli
+from queueing.simulate import simulateMultiplexer, multiplexerRates
+from queueing.occupancy import backlogSeries, occupancyDistribution, littlesLaw
+from queueing.ecdf import ecdf, quantiles
+from queueing.gof import goodnessOfFit
+from queueing.metrics import sampleMetrics, streamMetrics, systemMetrics, summaryMetrics, printMetrics
+from queueing.theory import mg1WaitMean, mg1WaitCdf
+
+if metricsOnly:
+    # Progress messages go to stderr, leaving stdout for the JSON document
+    metricsOut, sys.stdout = sys.stdout, sys.stderr
 
 # Sanity checks
 assert sum(packetDistribution) == 1,\
@@ -57,84 +83,151 @@ print("Packet distribution:")
 print("\t- %s%% of packets with length %s Bytes" % (packetDistribution[0] * 100, packetLengths[0]))
 print("\t- %s%% of packets with length %s Bytes" % (packetDistribution[1] * 100, packetLengths[1]))
 
+# Independent random streams for arrivals & service, derived from a single seed (see queueing/rng.py)
+seedSeq = seedSequence(seed)
+arrGen, servGen = spawnGenerators(seedSeq)
+print("Random seed = %s" % seedSeq.entropy)
+
 # Initialize figure
-fig = plt.figure(figsize=(10, 8))
-ax = fig.add_subplot(111)
+if not metricsOnly:
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111)
 
-# Convert lengths to Bits and calculate service times
-packetLengths = [i * 8 for i in packetLengths]
-serviceTimes = [float(i) / outgoingBW for i in packetLengths]
+# Service time of each packet type, avg. packet tx rate (mu) and lambda = rho * mu
+serviceTimes, servRate, arrRate = multiplexerRates(packetLengths, packetDistribution, outgoingBW, rho)
+avgPktLength = outgoingBW / servRate # Bits
 
-avgPktLength = 0
-for i in range(len(packetLengths)):
-    avgPktLength += packetLengths[i] * packetDistribution[i]
+if numReplications > 1:
+    # Replication mode: simulate all replications as one (numReplications x numPackets) block; no plots
+    print("\nRunning %s replications" % numReplications)
+    stats = replicateLindley(lambda r, n: (exponential(arrGen, arrRate, (r, n)),
+                                         np.take(serviceTimes, bernoulli(servGen, packetDistribution[1], (r, n)))),
+                             numReplications, numPackets)
+    summary = summarize(stats)
+    printSummary(summary)
+    if metricsOnly:
+        printMetrics({'model': 'M/G/1', 'numReplications': numReplications, 'numPackets': numPackets,
+                      'seed': seedSeq.entropy, 'replications': summaryMetrics(summary)}, metricsOut)
+    sys.exit(0)
 
-# List of Bernouli RVs
-# Flip coin once per trial, P(success) = packetDistribution[1], repeat numPackets trials
-packetSizeIndex = binomial(1, packetDistribution[1], numPackets)
+if sweepLoads is not None:
+    # Sweep mode: one set of random numbers shared by every load level (see queueing/sweep.py)
+    loads = np.asarray(sweepLoads, dtype=float)
+    print("\nSweeping %s load levels" % len(loads))
+    stats = sweepLindley(exponential(arrGen, 1.0, numPackets),
+                         np.take(serviceTimes, bernoulli(servGen, packetDistribution[1], numPackets)),
+                         loads * servRate)
+    theorMeans = mg1WaitMean(loads * servRate, serviceTimes, packetDistribution) # Pollaczek-Khinchine: W = lambda * E[S^2] / (2 * (1 - rho))
+    for i in range(len(loads)):
+        print("\t- rho = %s: mean wait = %s (theoretical %s); 99th percentile wait = %s"
+                % (loads[i], stats['meanWait'][i], theorMeans[i], stats['p99Wait'][i]))
+    if metricsOnly:
+        printMetrics(dict(stats, model='M/G/1', numPackets=numPackets, seed=seedSeq.entropy,
+                          loads=loads, theoreticalMeanWait=theorMeans), metricsOut)
+        sys.exit(0)
 
-servRate = outgoingBW / avgPktLength # Avg. packet tx rate (mu)
-arrRate = rho * servRate # lambda = rho * mu
-interArrivals = [expovariate(arrRate) for i in range(numPackets)]
+    ax.plot(loads, stats['meanWait'], 'o-', label="Empirical (from Lindley's)", linewidth=2.0)
+    ax.plot(loads, theorMeans, label="Theoretical", linewidth=2.0)
+    ax.legend(loc='upper left')
+    plt.grid()
+    plt.xlabel("System Utilization (rho)")
+    plt.ylabel("Mean Waiting Time (s)")
+    plt.title("Mean Waiting Time vs Load for M/G/1 System")
+    fig.savefig('wait-vs-load.png')
+    print("Finished plotting all figures!")
+    sys.exit(0)
 
 # Simulate using Lindley's
 # Lindley's equation: W(n) = max(0, W(n - 1) + serviceTime(n - 1) - interArrivalTime(n))
 # Note: Service time for packet i dependent on packetSizeIndex[i]
-waitTimes = [0] * numPackets
-for i in range(1, numPackets):
-    waitTimes[i] = max(0, waitTimes[i - 1] + serviceTimes[packetSizeIndex[i - 1]] - interArrivals[i])
+if chunkSize is None:
+    # See queueing/simulate.py. With counterRNG, every worker generates & simulates its own
+    # segment of the path, and the same seed gives identical waitTimes for any numWorkers
+    interArrivals, pktServiceTimes, waitTimes = simulateMultiplexer(
+        numPackets, packetLengths, packetDistribution, outgoingBW, rho,
+        seedSeq.entropy, numWorkers, counterRNG)
+    maxWait = waitTimes.max()
+else:
+    # Streaming mode: generate & simulate chunkSize packets at a time, keeping only running stats
+    waitStats = WaitStats()
+    waitHist = WaitHistogram(binWidth=0.01 * avgPktLength / outgoingBW)
+    streamLindley(lambda n: (exponential(arrGen, arrRate, n),
+                             np.take(serviceTimes, bernoulli(servGen, packetDistribution[1], n))),
+                  numPackets, [waitStats, waitHist], chunkSize)
+    maxWait = waitStats.max
 
+# M/G/1 CDF: no closed form, so the Pollaczek-Khinchine transform is inverted numerically (see queueing/theory.py)
+x_range, theorWaitTimes, theorError = mg1WaitCdf(arrRate, serviceTimes, packetDistribution,
+                                                 maxTime=max(maxWait, max(serviceTimes)))
+print("Theoretical CDF accurate to within %s" % theorError)
+
+
+if metricsOnly:
+    # Headless mode: summary statistics only, no figures
+    metrics = {'model': 'M/G/1', 'numPackets': numPackets, 'packetLengths': packetLengths, 'packetDistribution': packetDistribution,
+               'outgoingBW': outgoingBW, 'rho': rho,
+               'seed': seedSeq.entropy, 'theoreticalMeanWait': mg1WaitMean(arrRate, serviceTimes, packetDistribution)}
+    if chunkSize is None:
+        arrEmpEnv = np.cumsum(interArrivals)
+        metrics['wait'] = sampleMetrics(waitTimes)
+        metrics['fit'] = goodnessOfFit(waitTimes, lambda t: np.interp(t, x_range, theorWaitTimes, left=0.0), autocorrelated=True)
+        metrics['system'] = systemMetrics(arrEmpEnv, arrEmpEnv + waitTimes + pktServiceTimes)
+    else:
+        metrics['wait'] = streamMetrics(waitStats, waitHist)
+    printMetrics(metrics, metricsOut)
+    sys.exit(0)
 
 print("\nPlotting figures ... please wait")
 
 # Plot CDF
-# NOTE: Using matplotlib's histogram to generate CDF results in last point y = 0
-#       Hacky workaround is to delete the last point: ret[2][0].set_xy(ret[2][0].get_xy()[:-1])
-numBins = 10000 if numPackets > 10000 else numPackets
-ret = ax.hist(waitTimes, numBins, density=True,
-                cumulative=True, histtype='step',
-                label="Empirical (from Lindley's)", linewidth=2.0)
-ret[2][0].set_xy(ret[2][0].get_xy()[:-1])
+# Exact empirical CDF (sorted once, reduced to ~1 point per pixel with the upper tail kept exact)
+if chunkSize is None:
+    x, F = ecdf(waitTimes)
+    ax.plot(x, F, label="Empirical (from Lindley's)", drawstyle='steps-post', linewidth=2.0)
+    print("99th / 99.99th percentile wait = %s / %s" % tuple(quantiles(waitTimes, [0.99, 0.9999])))
 
+    # Kolmogorov-Smirnov & Anderson-Darling scores vs theory (p-values allow for correlated wait times)
+    fit = goodnessOfFit(waitTimes, lambda t: np.interp(t, x_range, theorWaitTimes, left=0.0), autocorrelated=True)
+    print("KS = %s (p = %s); AD = %s (p = %s); effective samples = %s"
+            % (fit['ks'], fit['ksPValue'], fit['ad'], fit['adPValue'], fit['effectiveN']))
+    with open('goodness-of-fit.json', 'w') as f:
+        json.dump(fit, f, indent=4)
+else:
+    x, F = waitHist.cdf()
+    ax.plot(x, F, label="Empirical (from Lindley's)", drawstyle='steps', linewidth=2.0)
+
+ax.plot(x_range, theorWaitTimes, label="Theoretical (Pollaczek-Khinchine)", linewidth=2.0)
 ax.legend(loc='right')
 plt.grid()
 plt.xlabel("Waiting Time (s)")
-plt.title("Empirical Waiting Time CDF for M/G/1 System")
+plt.title("Empirical and Theoretical Waiting Time CDF for M/G/1 System")
 
 fig.savefig('empirical-cdf.png')
 #plt.show()
 
+if chunkSize is not None:
+    # The remaining plots need every packet, which streaming mode does not keep
+    print("Mean wait = %s; max wait = %s; 99th percentile wait <= %s"
+            % (waitStats.mean, waitStats.max, waitHist.quantile(0.99)))
+    print("Finished plotting all figures!")
+    sys.exit(0)
+
 
 # Plot packets in system
 # Logically, PacketsInSystem(t) = ArrivalEmpEnv(t) - DepartureEmpEnv(t)
-# Split time into discrete number of intervals (max 10000) and calculate backlog for each
+# Split time into discrete number of intervals (max 10000) and calculate the exact backlog at each
 arrEmpEnv = np.cumsum(interArrivals)
-departEmpEnv = [arrEmpEnv[i] + waitTimes[i] for i in range(numPackets)]
+departEmpEnv = arrEmpEnv + waitTimes
 
 numPoints = 10000 if numPackets > 10000 else numPackets
-timeInterval = max(departEmpEnv) / numPoints
-pktInSys = [0] * numPoints
-arrIndex = 0
-departIndex = 0
-for i in range(numPoints):
-    intervalEnd = timeInterval * (i+1)
-
-    for arrIndex in range(arrIndex, numPackets):
-        if arrEmpEnv[arrIndex] > intervalEnd:
-            break;
-
-    for departIndex in range(departIndex, numPackets):
-        if departEmpEnv[departIndex] > intervalEnd:
-            break;
-
-    numArrivals = arrIndex - 1 if arrIndex > 0 else 0
-    numDepartures = departIndex - 1 if departIndex > 0 else 0
-    pktInSys[i] = numArrivals - numDepartures
+timeInterval = np.max(departEmpEnv) / numPoints
+gridTimes = np.arange(numPoints) * timeInterval
+pktInSys = backlogSeries(arrEmpEnv, departEmpEnv, gridTimes)
 
 fig = plt.figure(figsize=(10, 8))
 ax = fig.add_subplot(111)
-ax.plot([i * timeInterval for i in range(numPoints)], pktInSys,
-        label="Packets in System", drawstyle='steps', linewidth=2.0)
+ax.plot(gridTimes, pktInSys,
+        label="Packets in System", drawstyle='steps-post', linewidth=2.0)
 ax.legend(loc='right')
 plt.grid()
 plt.xlabel("Time (s)")
@@ -144,12 +237,34 @@ plt.title("Packets Waiting or being Processed vs Time")
 fig.savefig('pkts-in-system.png')
 
 
+# Exact time-weighted distribution of packets in system, from the merged arrival & departure events
+# Note: departEmpEnv is when service starts, so add the service time to count the packet being serviced
+systemDepartures = departEmpEnv + pktServiceTimes
+occupancyProbs, meanOccupancy = occupancyDistribution(arrEmpEnv, systemDepartures)
+little = littlesLaw(arrEmpEnv, systemDepartures, end=arrEmpEnv[-1]) # Window ends at the last arrival
+print("Mean packets in system = %s" % meanOccupancy)
+print("Little's law (until last arrival): L = %s; lambda * W = %s; gap = %s"
+        % (little['L'], little['lambda'] * little['W'], little['gap']))
+
+fig = plt.figure(figsize=(10, 8))
+ax = fig.add_subplot(111)
+numInSystem = np.arange(len(occupancyProbs))
+ax.bar(numInSystem, occupancyProbs, label="Empirical (time-weighted)")
+ax.legend(loc='right')
+plt.grid()
+plt.xlabel("Packets in System")
+plt.ylabel("Probability")
+plt.title("Time-Weighted Distribution of Packets in System")
+
+fig.savefig('occupancy-distribution.png')
+
+
 # Plot per-packet wait time
 # Bar plots get exponentially slow when number of points is large (over ~1000), so let's switch to "fill"
 fig = plt.figure(figsize=(10, 8))
 ax = fig.add_subplot(111)
 if numPackets > 1000:
-    waitTimes.append(0) # To close the polygon for "fill" to work
+    waitTimes = np.append(waitTimes, 0) # To close the polygon for "fill" to work
     ax.fill(range(numPackets + 1),
             waitTimes, '.',
             label="Wait Time", linewidth=2.0)
@@ -0,0 +1,19 @@
+'''
+Shared simulation engines used by the queueing demos.
+
+Each demo lives in its own folder (e.g. Wait-Times-MM1/main.py) and adds the
+repository root to sys.path so it can import the modules in this package.
+
+The models can also be run without the demo scripts, either from Python
+(with the repository root on sys.path):
+
+    from queueing import simulateMM1
+    run = simulateMM1(10**6, 0.8, 1.0, seed=1)   # run.waitTimes, ...
+
+or from the command line (python -m queueing --help, see __main__.py).
+'''
+from .simulate import simulateMM1, simulateMD1, simulateMultiplexer, \
+                      simulateTokenBucket, simulatePolicer, simulateMarker, simulateFlowPolicer, \
+                      streamTokenBucket, streamPolicer, multiplexerRates, packetLengthSamples, \
+                      QueueRun, ShaperRun, PolicerRun, MarkerRun, FlowPolicerRun
+from .occupancy import backlogSeries
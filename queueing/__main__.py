@@ -0,0 +1,394 @@
+'''
+Command line interface to the simulations in queueing/simulate.py, so runs
+can be configured with flags instead of editing a script's INPUT PARAMS.
+Run from the repository root, e.g.:
+
+    python -m queueing mm1 --packets 100000 --arr-rate 0.8 --seed 1
+    python -m queueing multiplexer --rho 0.9 --workers 4 --save run.npz
+    python -m queueing policer --token-rate 300 --bucket-size 2
+    python -m queueing policer --engine gcra --stream --packets 1000000000
+    python -m queueing marker --cir 300 --cbs 5 --pir 400 --pbs 10
+    python -m queueing flow-policer --flows 100000 --zipf 1 --packets 100000000 --token-rate 0.01
+    python -m queueing sweep policer --grid tokenRate=300,350,400 --grid bucketSize=1:10:10 \
+        --save sweep.csv --plot sweep.png
+    python -m queueing dimension policer --target 1e-3 --token-rate 400
+
+Summary statistics are printed as one JSON document (see metrics.py), and
+--save writes the simulated arrays to a .npz file. The sweep command runs
+one independent simulation per grid point across all cores (see grid.py);
+its --save writes the per-point statistics (.csv or .npy) and --plot draws
+them. The dimension command searches for the smallest bucket size or token
+rate meeting a drop rate (policer) or p99 delay (token-bucket) target, with a
+confidence interval (see dimensioning.py). The marker command runs an srTCM,
+or a trTCM if --pir is given (see marker.py), and the flow-policer command
+one bucket per flow over an interleaved stream, streamed block by block
+(see flowpolicer.py). The token-bucket and policer commands take --engine
+gcra for the exact integer-nanosecond engine (see gcra.py), and --stream to
+run it chunk by chunk in constant memory (exact totals only, no --save).
+Nothing else is plotted.
+'''
+import argparse
+import sys
+
+import numpy as np
+
+from .rng import seedSequence
+from .metrics import sampleMetrics, systemMetrics, printMetrics
+from .simulate import simulateMM1, simulateMD1, simulateMultiplexer, \
+                      simulateTokenBucket, simulatePolicer, simulateMarker, simulateFlowPolicer, \
+                      streamTokenBucket, streamPolicer, multiplexerRates, ENGINES
+from .marker import colorStats
+from .gcra import NS_PER_SECOND, DEFAULT_CHUNK_SIZE
+from .theory import mm1WaitMean, md1WaitMean, mg1WaitMean
+from .grid import MODELS, parameterGrid, gridSweep, saveSweep, plotSweep
+from .dimensioning import dimensionPolicer, dimensionShaper
+
+# CLI option -> simulate* parameter, for the sweep command
+PARAMETERS = {'arr_rate': 'arrRate', 'serv_rate': 'servRate', 'token_rate': 'tokenRate',
+              'bucket_size': 'bucketSize', 'initial_tokens': 'initialTokens',
+              'packet_lengths': 'packetLengths', 'packet_distribution': 'packetDistribution',
+              'bandwidth': 'outgoingBW', 'rho': 'rho',
+              'cir': 'cir', 'cbs': 'cbs', 'ebs': 'ebs', 'pir': 'pir', 'pbs': 'pbs',
+              'flows': 'numFlows', 'zipf': 'zipfExponent'}
+
+
+def _packetCount(text):
+    # argparse type for --packets: a whole number of packets, at least 1
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: %r" % text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got %s" % value)
+    return value
+
+
+def _queueMetrics(run):
+    arrEmpEnv = np.cumsum(run.interArrivals)
+    return {
+        'wait': sampleMetrics(run.waitTimes),
+        'system': systemMetrics(arrEmpEnv, arrEmpEnv + run.waitTimes + run.serviceTimes),
+    }
+
+
+def runMM1(args, seed):
+    run = simulateMM1(args.packets, args.arr_rate, args.serv_rate, seed, args.workers, args.counter_rng)
+    metrics = {'model': 'M/M/1', 'arrRate': args.arr_rate, 'servRate': args.serv_rate,
+               'theoreticalMeanWait': mm1WaitMean(args.arr_rate, args.serv_rate)}
+    return run, dict(metrics, **_queueMetrics(run))
+
+
+def runMD1(args, seed):
+    run = simulateMD1(args.packets, args.arr_rate, args.serv_rate, seed, args.workers, args.counter_rng)
+    metrics = {'model': 'M/D/1', 'arrRate': args.arr_rate, 'servRate': args.serv_rate,
+               'theoreticalMeanWait': md1WaitMean(args.arr_rate, args.serv_rate)}
+    return run, dict(metrics, **_queueMetrics(run))
+
+
+def runMultiplexer(args, seed):
+    if len(args.packet_lengths) != len(args.packet_distribution) or len(args.packet_lengths) != 2:
+        raise SystemExit("--packet-lengths and --packet-distribution need exactly 2 values each")
+    if not np.isclose(sum(args.packet_distribution), 1):
+        raise SystemExit("--packet-distribution must sum to 1")
+
+    run = simulateMultiplexer(args.packets, args.packet_lengths, args.packet_distribution,
+                              args.bandwidth, args.rho, seed, args.workers, args.counter_rng)
+    serviceTimes, servRate, arrRate = multiplexerRates(args.packet_lengths, args.packet_distribution,
+                                                       args.bandwidth, args.rho)
+    metrics = {'model': 'M/G/1', 'packetLengths': args.packet_lengths,
+               'packetDistribution': args.packet_distribution, 'outgoingBW': args.bandwidth,
+               'rho': args.rho, 'arrRate': arrRate, 'servRate': servRate,
+               'theoreticalMeanWait': mg1WaitMean(arrRate, serviceTimes, args.packet_distribution)}
+    return run, dict(metrics, **_queueMetrics(run))
+
+
+def _lengthArgs(args):
+    # Byte mode: packet lengths from a trace file or the packet length mix
+    if args.length_trace is not None:
+        return {'pktLengths': np.loadtxt(args.length_trace, ndmin=1)}
+    if args.byte_mode:
+        return {'packetLengths': args.packet_lengths, 'packetDistribution': args.packet_distribution}
+    return {}
+
+
+def _streamArgs(args):
+    # --stream runs the GCRA engine chunk by chunk (exact totals, no arrays)
+    if args.stream and args.engine != 'gcra':
+        raise SystemExit("--stream needs --engine gcra")
+    return dict(_lengthArgs(args), chunkSize=args.chunk_size)
+
+
+def runTokenBucket(args, seed):
+    metrics = {'model': 'token-bucket', 'engine': args.engine, 'arrRate': args.arr_rate,
+               'tokenRate': args.token_rate, 'bucketSize': args.bucket_size, 'byteMode': bool(_lengthArgs(args))}
+    if args.stream:
+        totals = streamTokenBucket(args.packets, args.arr_rate, args.token_rate, args.bucket_size, seed,
+                                   **_streamArgs(args))
+        metrics.update(totals, meanDelay=totals['totalDelay'] / float(totals['numPackets']) / NS_PER_SECOND)
+        return None, metrics
+
+    run = simulateTokenBucket(args.packets, args.arr_rate, args.token_rate, args.bucket_size, seed,
+                              engine=args.engine, **_lengthArgs(args))
+    metrics.update({'delay': sampleMetrics(run.departEmpEnv - run.arrEmpEnv),
+                    'interDeparture': sampleMetrics(np.diff(run.departEmpEnv)),
+                    'system': systemMetrics(run.arrEmpEnv, run.departEmpEnv)})
+    return run, metrics
+
+
+def runPolicer(args, seed):
+    metrics = {'model': 'policer', 'engine': args.engine, 'arrRate': args.arr_rate, 'tokenRate': args.token_rate,
+               'bucketSize': args.bucket_size, 'initialTokens': args.initial_tokens,
+               'byteMode': bool(_lengthArgs(args))}
+    if args.stream:
+        totals = streamPolicer(args.packets, args.arr_rate, args.token_rate, args.bucket_size, seed,
+                               initialTokens=args.initial_tokens, **_streamArgs(args))
+        metrics.update(totals, dropRate=totals['dropCount'] / float(args.packets))
+        if 'totalBytes' in totals:
+            metrics['byteDropRate'] = totals['droppedBytes'] / float(totals['totalBytes'])
+        return None, metrics
+
+    run = simulatePolicer(args.packets, args.arr_rate, args.token_rate, args.bucket_size, seed,
+                          initialTokens=args.initial_tokens, engine=args.engine, **_lengthArgs(args))
+    dropCount = np.count_nonzero(run.dropped)
+    metrics.update(dropCount=dropCount, dropRate=dropCount / float(args.packets))
+    if run.pktLengths is not None:
+        metrics['byteDropRate'] = run.pktLengths[run.dropped].sum() / run.pktLengths.sum()
+    return run, metrics
+
+
+def runFlowPolicer(args, seed):
+    run = simulateFlowPolicer(args.packets, args.arr_rate, args.flows, args.token_rate, args.bucket_size, seed,
+                              zipfExponent=args.zipf, initialTokens=args.initial_tokens, **_lengthArgs(args))
+    active = run.packetCounts > 0
+    dropCount = run.dropCounts.sum()
+    metrics = {'model': 'flow-policer', 'arrRate': args.arr_rate, 'numFlows': args.flows, 'zipfExponent': args.zipf,
+               'tokenRate': args.token_rate, 'bucketSize': args.bucket_size, 'initialTokens': args.initial_tokens,
+               'byteMode': run.byteCounts is not None, 'activeFlows': np.count_nonzero(active),
+               'dropCount': dropCount, 'dropRate': dropCount / float(args.packets),
+               'flowsWithDrops': np.count_nonzero(run.dropCounts),
+               'flowDropRate': sampleMetrics(run.dropCounts[active] / run.packetCounts[active].astype(np.float64))}
+    if run.byteCounts is not None:
+        metrics['byteDropRate'] = run.droppedBytes.sum() / run.byteCounts.sum()
+    return run, metrics
+
+
+def runMarker(args, seed):
+    run = simulateMarker(args.packets, args.arr_rate, args.cir, args.cbs, args.ebs, args.pir, args.pbs, seed,
+                         **_lengthArgs(args))
+    metrics = {'model': 'srTCM' if args.pir is None else 'trTCM', 'arrRate': args.arr_rate,
+               'cir': args.cir, 'cbs': args.cbs, 'byteMode': run.pktLengths is not None,
+               'colors': colorStats(run.colors, run.interArrivals, run.pktLengths)}
+    if args.pir is None:
+        metrics['ebs'] = args.ebs
+    else:
+        metrics.update(pir=args.pir, pbs=args.pbs)
+    return run, metrics
+
+
+def _parseValues(text):
+    # "start:stop:num" (evenly spaced, endpoints included) or "v1,v2,..."
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in text.split(',')])
+
+
+def _parseAssignments(items):
+    assignments = {}
+    for item in items:
+        name, _, values = item.partition('=')
+        if name not in PARAMETERS.values() or not values:
+            raise SystemExit("Expected NAME=VALUES with NAME one of %s, got %r"
+                             % (', '.join(sorted(PARAMETERS.values())), item))
+        assignments[name] = _parseValues(values)
+    return assignments
+
+
+def runSweep(args, seed):
+    # Parameters that aren't swept or set keep the model command's defaults
+    modelArgs = buildParser().parse_args([args.model])
+    fixed = dict((PARAMETERS[name], value) for name, value in vars(modelArgs).items() if name in PARAMETERS)
+    if not getattr(modelArgs, 'byte_mode', True):
+        # The length mix only applies in byte mode, i.e. once packetLengths is set
+        fixed['packetLengths'] = fixed['packetDistribution'] = None
+    for name, values in _parseAssignments(args.set).items():
+        fixed[name] = values.tolist() if len(values) > 1 else values[0].item()
+
+    grid = parameterGrid(**_parseAssignments(args.grid))
+    for name in grid:
+        fixed.pop(name, None)
+
+    results = gridSweep(args.model, grid, args.packets, seed, args.workers, **fixed)
+    if args.plot is not None:
+        import matplotlib
+        matplotlib.use('Agg')
+        names = list(grid)
+        y = args.y or [name for name in results.dtype.names if name not in grid][0]
+        ax = plotSweep(results, names[0], y, by=names[1] if len(names) > 1 else None)
+        ax.set_title("%s vs %s (%s, %s packets per point)" % (y, names[0], args.model, args.packets))
+        ax.figure.savefig(args.plot)
+        print("Saved plot to %s" % args.plot, file=sys.stderr)
+
+    metrics = {'model': args.model, 'numPoints': len(results), 'fixed': fixed,
+               'points': dict((name, results[name]) for name in results.dtype.names)}
+    return results, metrics
+
+
+def runDimension(args, seed):
+    parameter = getattr(args, 'search', 'bucketSize' if args.model == 'policer' else 'tokenRate')
+    if not hasattr(args, 'bucket_size'):
+        args.bucket_size = 2.0 if args.model == 'policer' else 5.0 # As in the demo scripts
+    options = {'parameter': parameter, 'numPackets': args.packets, 'seed': seed,
+               'tokenRate': args.token_rate, 'bucketSize': args.bucket_size,
+               'relTolerance': args.rel_tolerance, 'maxReplications': args.max_replications}
+    if args.bracket is not None:
+        options['bracket'] = tuple(args.bracket)
+    if args.model == 'policer':
+        result = dimensionPolicer(args.arr_rate, args.target, **options)
+    else:
+        result = dimensionShaper(args.arr_rate, args.target, quantile=args.quantile, **options)
+
+    metrics = {'model': args.model, 'search': parameter, 'target': args.target, 'arrRate': args.arr_rate,
+               'fixed': {'tokenRate': args.token_rate} if parameter == 'bucketSize' else {'bucketSize': args.bucket_size},
+               parameter: result.value, 'low': result.low, 'high': result.high,
+               'metric': dict((field, float(value)) for field, value in result.metric._asdict().items()),
+               'numReplications': result.numReplications, 'numProbes': result.numProbes}
+    return None, metrics
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog='python -m queueing', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--packets', type=_packetCount, default=10000, help="Number of packets")
+    common.add_argument('--seed', type=int, default=None, help="Random seed (random if not given)")
+    common.add_argument('--save', metavar='FILE', default=None, help="Save the simulated arrays to a .npz file")
+
+    lindley = argparse.ArgumentParser(add_help=False)
+    lindley.add_argument('--workers', type=int, default=1, help="Processes to split the Lindley run across")
+    lindley.add_argument('--counter-rng', action='store_true',
+                         help="Counter-based streams (same waits for any number of workers)")
+
+    rates = argparse.ArgumentParser(add_help=False)
+    rates.add_argument('--arr-rate', type=float, default=0.5, help="Arrival rate (lambda)")
+    rates.add_argument('--serv-rate', type=float, default=1.0, help="Service rate (mu)")
+
+    lengths = argparse.ArgumentParser(add_help=False)
+    lengths.add_argument('--arr-rate', type=float, default=350.0, help="Packet arrival rate")
+    lengths.add_argument('--byte-mode', action='store_true',
+                         help="Each token = 1 byte (token rates in bytes/s, bucket sizes in bytes)")
+    lengths.add_argument('--packet-lengths', type=int, nargs=2, default=[40, 1500],
+                         help="Byte mode: packet lengths (Bytes) of the two types")
+    lengths.add_argument('--packet-distribution', type=float, nargs=2, default=[0.25, 0.75],
+                         help="Byte mode: proportion of packets of each type")
+    lengths.add_argument('--length-trace', metavar='FILE', default=None,
+                         help="Byte mode: text file of packet lengths (Bytes), used in order")
+
+    def bucketOptions(bucketSize, help="Max tokens in bucket"):
+        # Token bucket options, with the bucket size of the matching demo script by default
+        bucket = argparse.ArgumentParser(add_help=False, parents=[lengths])
+        bucket.add_argument('--token-rate', type=float, default=350.0, help="Token generation rate")
+        bucket.add_argument('--bucket-size', type=float, default=bucketSize, help=help)
+        return bucket
+
+    engine = argparse.ArgumentParser(add_help=False)
+    engine.add_argument('--engine', choices=ENGINES, default='float',
+                        help="Float engine, or exact integer-nanosecond GCRA engine")
+    engine.add_argument('--stream', action='store_true',
+                        help="GCRA engine: run chunk by chunk in constant memory (exact totals only)")
+    engine.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Packets per chunk with --stream")
+
+    commands = parser.add_subparsers(dest='command', metavar='MODEL')
+    commands.required = True
+    commands.add_parser('mm1', parents=[common, lindley, rates], help="M/M/1 queue",
+                        formatter_class=argparse.ArgumentDefaultsHelpFormatter).set_defaults(run=runMM1)
+    commands.add_parser('md1', parents=[common, lindley, rates], help="M/D/1 queue",
+                        formatter_class=argparse.ArgumentDefaultsHelpFormatter).set_defaults(run=runMD1)
+
+    mux = commands.add_parser('multiplexer', parents=[common, lindley], help="Two-type packet multiplexer (M/G/1)",
+                              formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    mux.add_argument('--packet-lengths', type=int, nargs=2, default=[40, 1500], help="Packet lengths (Bytes)")
+    mux.add_argument('--packet-distribution', type=float, nargs=2, default=[0.25, 0.75],
+                     help="Proportion of packets of each length")
+    mux.add_argument('--bandwidth', type=float, default=1e8, help="Outgoing link bandwidth (bps)")
+    mux.add_argument('--rho', type=float, default=0.5, help="System utilization")
+    mux.set_defaults(run=runMultiplexer)
+
+    commands.add_parser('token-bucket', parents=[common, bucketOptions(5.0), engine], help="Token bucket shaper, infinite queue",
+                        formatter_class=argparse.ArgumentDefaultsHelpFormatter).set_defaults(run=runTokenBucket)
+    policer = commands.add_parser('policer', parents=[common, bucketOptions(2.0), engine], help="Token bucket policer, no queue",
+                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    policer.add_argument('--initial-tokens', type=float, default=0.0, help="Tokens in bucket at time 0")
+    policer.set_defaults(run=runPolicer)
+
+    flowPolicer = commands.add_parser('flow-policer', parents=[common, bucketOptions(2.0)],
+                                      help="One token bucket policer per flow (token rate & bucket size are per flow)",
+                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    flowPolicer.add_argument('--flows', type=int, default=1000, help="Number of flows")
+    flowPolicer.add_argument('--zipf', type=float, default=0.0,
+                             help="Flow popularity exponent: flow f carries a share ~ 1 / (f + 1)^zipf of the packets")
+    flowPolicer.add_argument('--initial-tokens', type=float, default=0.0, help="Tokens in each bucket at time 0")
+    flowPolicer.set_defaults(run=runFlowPolicer)
+
+    marker = commands.add_parser('marker', parents=[common, lengths], help="srTCM / trTCM three color marker",
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    marker.add_argument('--cir', type=float, default=300.0, help="Committed information rate")
+    marker.add_argument('--cbs', type=float, default=5.0, help="Committed burst size")
+    marker.add_argument('--ebs', type=float, default=10.0, help="Excess burst size (srTCM)")
+    marker.add_argument('--pir', type=float, default=None, help="Peak information rate (gives a trTCM)")
+    marker.add_argument('--pbs', type=float, default=10.0, help="Peak burst size (trTCM)")
+    marker.set_defaults(run=runMarker)
+
+    sweep = commands.add_parser('sweep', parents=[common], help="Parameter grid sweep over all cores",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    sweep.add_argument('model', choices=sorted(MODELS), help="Model to sweep")
+    sweep.add_argument('--grid', action='append', default=[], metavar='NAME=VALUES', required=True,
+                       help="Swept parameter (repeat for a multi-dimensional grid); VALUES is "
+                            "start:stop:num or a comma-separated list, NAME as in queueing/simulate.py")
+    sweep.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                       help="Parameter shared by every point (otherwise the model command's default)")
+    sweep.add_argument('--workers', type=int, default=None, help="Worker processes (default: all CPUs)")
+    sweep.add_argument('--plot', metavar='FILE', default=None,
+                       help="Plot a statistic against the first grid parameter, one curve per value of the second")
+    sweep.add_argument('--y', default=None, help="Statistic to plot (default: the first one)")
+    sweep.set_defaults(run=runSweep)
+
+    # The bucket size & searched parameter default to the model's (see runDimension), and
+    # SUPPRESS leaves them unset so the help doesn't print (default: None)
+    dimBucket = bucketOptions(argparse.SUPPRESS, help="Max tokens in bucket (default: 2 for policer, 5 for token-bucket)")
+    dim = commands.add_parser('dimension', parents=[common, dimBucket], help="Smallest bucket size / token rate meeting a target",
+                              formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    dim.add_argument('model', choices=['policer', 'token-bucket'], help="Model to dimension")
+    dim.add_argument('--target', type=float, required=True,
+                     help="Max mean drop rate (policer) or delay quantile in seconds (token-bucket)")
+    dim.add_argument('--search', choices=['bucketSize', 'tokenRate'], default=argparse.SUPPRESS,
+                     help="Parameter searched (default: bucketSize for policer, tokenRate for token-bucket); "
+                          "the other one is fixed")
+    dim.add_argument('--bracket', type=float, nargs=2, default=None, metavar=('LOW', 'HIGH'), help="Range searched")
+    dim.add_argument('--quantile', type=float, default=0.99, help="Delay quantile (token-bucket)")
+    dim.add_argument('--rel-tolerance', type=float, default=0.05, help="Target relative width of the CI")
+    dim.add_argument('--max-replications', type=int, default=256, help="Max number of traces")
+    dim.set_defaults(run=runDimension)
+    return parser
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    seedSeq = seedSequence(args.seed)
+    run, metrics = args.run(args, seedSeq.entropy)
+    metrics = dict(metrics, numPackets=args.packets, seed=seedSeq.entropy)
+
+    if args.save is not None and run is None:
+        raise SystemExit("--save is not supported by %s" % args.command)
+    if args.save is not None and args.command == 'sweep':
+        saveSweep(args.save, run)
+        print("Saved sweep to %s" % args.save, file=sys.stderr)
+    elif args.save is not None:
+        np.savez(args.save, **dict((name, values) for name, values in run._asdict().items()
+                                   if values is not None))
+        print("Saved arrays to %s" % args.save, file=sys.stderr)
+    printMetrics(metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+'''
+Inverse dimensioning of the token buckets: the smallest bucketSize or
+tokenRate that meets a drop or delay target.
+
+The target is on the mean of a per-replication metric (the drop rate of the
+policer, or a delay quantile of the shaper) over R independent traces of N
+packets. The traces are drawn once and every probe of the search reuses them
+(common random numbers), so one probe is one vectorized pass over the R x N
+block (see replications.py) and the estimated metric is a deterministic,
+decreasing function of the parameter that bisection can search directly.
+
+Error bars come from inverting the confidence interval of the metric: the
+parameter's interval runs from the smallest value whose CI lower bound meets
+the target to the smallest value whose CI upper bound does. If that interval
+is wider than the requested tolerance, more traces are added (the old ones
+are kept) and the search is repeated, up to maxReplications. The answers
+move little between rounds, so each search of a new round starts from the
+previous round's answer, widened a little (and grown until it brackets the
+new answer), rather than from the whole bracket again.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from .replications import confidenceInterval
+from .rng import seedSequence, spawnGenerators, exponential, ARRIVALS
+from .tokenbucket import shaperDepartures, policerDrops
+
+# value: smallest parameter whose estimated metric meets the target
+# low, high: confidence interval for it (high is inf if even the bracket's
+#            upper end can't be shown to meet the target)
+# metric: ConfidenceInterval of the metric at value
+Dimensioning = namedtuple('Dimensioning', ['value', 'low', 'high', 'metric',
+                                           'numReplications', 'numProbes'])
+
+
+def _smallestMeeting(meets, low, high, integer, tolerance, guess=None):
+    '''
+    Bisection for the smallest x in [low, high] with meets(x), given that
+    meets(high) holds and meets is monotone.
+
+    guess: Optional (a, b) range expected to hold the answer; it's widened
+           by 10% and then grown geometrically (within [low, high]) until
+           meets(a) fails & meets(b) holds, and the bisection starts there
+    '''
+    if guess is not None:
+        a, b = guess
+        margin = max(0.1 * (b - a), 1 if integer else tolerance)
+        if integer:
+            margin = int(np.ceil(margin))
+        a, b = max(low, a - margin), min(high, b + margin)
+        step = margin
+        while a > low and meets(a):
+            a, b = max(low, a - step), a
+            step *= 2
+        while b < high and not meets(b):
+            a, b = b, min(high, b + step)
+            step *= 2
+        low, high = a, b
+
+    if meets(low):
+        return low
+    while high - low > (1 if integer else tolerance):
+        mid = (low + high) // 2 if integer else 0.5 * (low + high)
+        if meets(mid):
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def dimension(evaluate, sampleBatch, target, low, high, integer=False, tolerance=None,
+              relTolerance=0.05, level=0.95, minReplications=8, maxReplications=256):
+    '''
+    Finds the smallest parameter value in [low, high] whose mean metric is
+    at most target.
+
+    evaluate: Function taking (value, traces) and returning the metric of
+              each trace (an array of length R), decreasing in value
+    sampleBatch: Function taking r and returning r new traces (rows)
+    integer: Search integer values only
+    tolerance: Bisection resolution (default: (high - low) / 1024, or 1 for
+               integer searches)
+    relTolerance: Stop once the parameter's CI is no wider than
+                  relTolerance * value (+ tolerance)
+    level: Confidence level
+    minReplications, maxReplications: Initial & max number of traces
+
+    Returns a Dimensioning. Raises ValueError if the mean metric doesn't
+    meet the target at high.
+    '''
+    if integer:
+        low, high = int(np.ceil(low)), int(np.floor(high))
+    if tolerance is None:
+        tolerance = 1 if integer else (high - low) / 1024.0
+    traces = sampleBatch(minReplications)
+    numProbes = 0
+    previous = None # (value, lowBound, highBound) of the previous round
+
+    while True:
+        cache = {}
+
+        def ci(value):
+            if value not in cache:
+                cache[value] = confidenceInterval(evaluate(value, traces), level)
+            return cache[value]
+
+        if ci(high).mean > target:
+            raise ValueError("Target %s not met at the upper end of the bracket (%s: %s)"
+                             % (target, high, ci(high).mean))
+
+        guesses = [None] * 3
+        if previous is not None:
+            # More traces mostly narrow the CI, so the new answers lie near the old ones
+            prevValue, prevLow, prevHigh = previous
+            guesses = [(prevLow, min(prevHigh, high)), (prevLow, prevValue), (prevValue, min(prevHigh, high))]
+
+        value = _smallestMeeting(lambda v: ci(v).mean <= target, low, high, integer, tolerance, guesses[0])
+        lowBound = _smallestMeeting(lambda v: ci(v).low <= target, low, value, integer, tolerance,
+                                    guesses[1] and (min(guesses[1][0], value), min(guesses[1][1], value)))
+        if ci(high).high <= target:
+            highBound = _smallestMeeting(lambda v: ci(v).high <= target, value, high, integer, tolerance,
+                                         guesses[2] and (max(guesses[2][0], value), max(guesses[2][1], value)))
+        else:
+            highBound = float('inf')
+        numProbes += len(cache)
+        previous = (value, lowBound, highBound)
+
+        numReplications = traces.shape[0]
+        if highBound - lowBound <= relTolerance * value + tolerance or numReplications >= maxReplications:
+            return Dimensioning(value, lowBound, highBound, ci(value), numReplications, numProbes)
+
+        # Not tight enough: double the number of traces, keeping the old ones
+        traces = np.concatenate([traces, sampleBatch(min(numReplications, maxReplications - numReplications))])
+
+
+def _parameters(parameter, value, tokenRate, bucketSize):
+    if parameter not in ('tokenRate', 'bucketSize'):
+        raise ValueError("parameter must be 'tokenRate' or 'bucketSize', got %r" % (parameter,))
+    if parameter == 'tokenRate':
+        if bucketSize is None:
+            raise ValueError("Searching tokenRate needs a fixed bucketSize")
+        return value, bucketSize
+    if tokenRate is None:
+        raise ValueError("Searching bucketSize needs a fixed tokenRate")
+    return tokenRate, value
+
+
+def dimensionPolicer(arrRate, targetDropRate, parameter='bucketSize', bracket=(1, 1000),
+                     tokenRate=None, bucketSize=None, numPackets=10**5, seed=None,
+                     initialTokens=0.0, **options):
+    '''
+    Smallest bucketSize (at a given tokenRate) or tokenRate (at a given
+    bucketSize) that keeps the policer's drop rate at most targetDropRate.
+
+    arrRate: Packet arrival rate (Poisson)
+    parameter: 'bucketSize' (integer search) or 'tokenRate'
+    bracket: (low, high) range searched
+    numPackets: Packets per trace
+    seed: Integer seed or SeedSequence for the traces
+    options: Passed to dimension() (tolerance, relTolerance, level, ...)
+    '''
+    arrGen = spawnGenerators(seedSequence(seed))[ARRIVALS]
+    options.setdefault('integer', parameter == 'bucketSize')
+
+    def evaluate(value, traces):
+        rate, size = _parameters(parameter, value, tokenRate, bucketSize)
+        dropCount, _ = policerDrops(traces, rate, size, initialTokens)
+        return dropCount / float(numPackets)
+
+    return dimension(evaluate, lambda r: exponential(arrGen, arrRate, (r, numPackets)),
+                     targetDropRate, bracket[0], bracket[1], **options)
+
+
+def dimensionShaper(arrRate, targetDelay, parameter='tokenRate', bracket=None, quantile=0.99,
+                    tokenRate=None, bucketSize=None, numPackets=10**5, seed=None, **options):
+    '''
+    Smallest tokenRate (at a given bucketSize) or bucketSize (at a given
+    tokenRate) that keeps the shaper's delay quantile at most targetDelay.
+    The metric of a trace is the given quantile of its packets' delays
+    (exact order statistic, as in ecdf.quantiles).
+
+    bracket: (low, high) range searched (default: arrRate to 10 * arrRate for
+             tokenRate, 1 to 1000 for bucketSize)
+    See dimensionPolicer for the other arguments.
+    '''
+    if bracket is None:
+        bracket = (float(arrRate), 10.0 * arrRate) if parameter == 'tokenRate' else (1, 1000)
+    arrGen = spawnGenerators(seedSequence(seed))[ARRIVALS]
+    options.setdefault('integer', parameter == 'bucketSize')
+    rank = min(max(int(np.ceil(quantile * numPackets)) - 1, 0), numPackets - 1)
+
+    def evaluate(value, arrEmpEnv):
+        rate, size = _parameters(parameter, value, tokenRate, bucketSize)
+        delays = shaperDepartures(arrEmpEnv, rate, size) - arrEmpEnv
+        return np.partition(delays, rank, axis=1)[:, rank]
+
+    return dimension(evaluate, lambda r: np.cumsum(exponential(arrGen, arrRate, (r, numPackets)), axis=1),
+                     targetDelay, bracket[0], bracket[1], **options)
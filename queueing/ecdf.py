@@ -0,0 +1,62 @@
+'''
+Exact empirical CDFs for plotting, without binning.
+
+The samples are sorted once; the ECDF is then the step curve through
+(x[i], (i + 1) / n). Drawing every step of a large sample is wasteful, so the
+curve is reduced to roughly one point per pixel: points are kept on an even
+grid in probability (y) and in value (x), which bounds the gap between kept
+points to about a pixel in both directions. The upper tail is kept exactly
+(every sample), so high percentiles stay accurate.
+
+When only a few quantiles are needed, quantiles() uses np.partition instead
+of a full sort.
+'''
+import numpy as np
+
+DEFAULT_MAX_POINTS = 2000 # ~ one point per pixel of a 10 inch wide figure
+DEFAULT_TAIL_FRACTION = 1e-3 # Top 0.1% of samples are always kept exactly
+DEFAULT_MAX_TAIL_POINTS = 100000
+
+
+def ecdf(samples, maxPoints=DEFAULT_MAX_POINTS, tailFraction=DEFAULT_TAIL_FRACTION,
+         maxTailPoints=DEFAULT_MAX_TAIL_POINTS):
+    '''
+    Computes the exact empirical CDF of samples, reduced for plotting.
+
+    samples: Sample values (any order)
+    maxPoints: Points kept along each axis outside the tail
+    tailFraction: Fraction of largest samples kept exactly
+    maxTailPoints: Cap on the number of exact tail points
+
+    Returns (x, F) to be drawn with drawstyle='steps-post': F[i] is the
+    fraction of samples <= x[i].
+    '''
+    x = np.sort(np.asarray(samples, dtype=np.float64).reshape(-1))
+    n = x.shape[0]
+    if n == 0:
+        return x, x.copy()
+
+    # Even grid in probability, even grid in value, plus the exact tail
+    byProb = np.ceil(np.linspace(0, 1, maxPoints + 1)[1:] * n).astype(np.int64) - 1
+    byValue = np.searchsorted(x, np.linspace(x[0], x[-1], maxPoints + 1), side='right') - 1
+    numTail = min(int(n * tailFraction), maxTailPoints)
+    tail = np.arange(n - numTail, n)
+
+    keep = np.unique(np.concatenate((byProb, byValue, tail, [n - 1])))
+    keep = keep[keep >= 0]
+
+    return x[keep], (keep + 1) / float(n)
+
+
+def quantiles(samples, probs):
+    '''
+    Exact empirical quantiles (the smallest sample with ECDF >= p) for a few
+    probabilities, using np.partition rather than a full sort. An empty
+    sample gives NaN for every probability.
+    '''
+    samples = np.asarray(samples, dtype=np.float64).reshape(-1)
+    n = samples.shape[0]
+    if n == 0:
+        return np.full(np.shape(probs), np.nan)
+    ranks = np.clip(np.ceil(np.asarray(probs) * n).astype(np.int64) - 1, 0, n - 1)
+    return np.partition(samples, np.unique(ranks))[ranks]
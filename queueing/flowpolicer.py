@@ -0,0 +1,222 @@
+'''
+Per-flow policing: one token bucket per flow over one interleaved packet
+stream, as in a router's policer table.
+
+Each packet carries a flow ID. The table holds the tokens and the time of the
+last packet of every flow in arrays indexed by flow ID, so a flow's bucket is
+refilled by tokenRate * (time since its own last packet) when its next packet
+arrives. Each flow is then exactly the single-bucket policer of
+tokenbucket.py run on that flow's packets.
+
+The stream is processed in blocks of packets. Within a block the packets are
+grouped by flow (a stable sort on the flow ID, so each flow's packets stay in
+arrival order, with the run lengths from a bincount). Flows are then stepped
+in lockstep: step k handles the k-th packet of every flow that has one in the
+block, as one NumPy operation over those flows. Runs are ordered longest
+first, so the flows still active at step k are a prefix of the arrays. A flow
+with a very long run in the block (more than LONG_RUN packets, e.g. a heavy
+hitter) would drag the lockstep out to one NumPy operation per packet, so the
+long runs are cut into blocks instead and all of them go through the
+policer's blocked scan together (see tokenbucket.py).
+
+Only the tables and one block live in memory, so streams of 10^8 packets or
+more can be fed through a FlowPolicer block by block (see streamFlowPolicer).
+Many light flows go fastest: ~4 Mpkt/s for 10^5 equally loaded flows (10^8
+packets in ~25 s). Heavy hitters cost more, as the blocked scan of their
+runs falls back to a sequential sweep when their buckets rarely fill: ~2
+Mpkt/s for 2 flows with 1000-token buckets and token rates just above their
+arrival rates, or for 10^5 flows with Zipf(1) shares.
+'''
+import numpy as np
+
+from .tokenbucket import _policerLockstep, _policerSequential, _scanBlocks
+
+FLOW_BLOCK_SIZE = 2**20 # Packets per block
+LONG_RUN = 1024 # Runs longer than this go through the blocked scan instead of the lockstep over flows
+SCAN_BLOCK_SIZE = 256 # Packets per block of the blocked scan
+
+
+def flowSamples(gen, numFlows, size, zipfExponent=0.0):
+    '''
+    Flow ID of each packet. Flow f carries a share of the packets proportional
+    to 1 / (f + 1)^zipfExponent (0 for equally loaded flows).
+    '''
+    if zipfExponent == 0:
+        return gen.integers(0, numFlows, size)
+    weights = np.cumsum(np.arange(1, numFlows + 1, dtype=np.float64) ** -zipfExponent)
+    flowIds = np.searchsorted(weights, gen.random(size) * weights[-1], side='right')
+    return np.minimum(flowIds, numFlows - 1, out=flowIds)
+
+
+class FlowPolicer(object):
+    '''
+    Table of token bucket policers, one per flow, fed one block of packets at
+    a time (each token = 1 packet, or 1 byte in byte mode).
+
+    numFlows: Number of flows (flow IDs are 0 ... numFlows - 1)
+    tokenRate, bucketSize: Token generation rate (per second) & max tokens of
+                           each flow's bucket (scalars, or one per flow)
+    initialTokens: Tokens in each bucket at time 0 (scalar, or one per flow)
+    '''
+    def __init__(self, numFlows, tokenRate, bucketSize, initialTokens=0.0):
+        self.numFlows = numFlows = int(numFlows)
+        self.tokenRates = np.broadcast_to(np.asarray(tokenRate, dtype=np.float64), (numFlows,))
+        self.bucketSizes = np.broadcast_to(np.asarray(bucketSize, dtype=np.float64), (numFlows,))
+        self.numTokens = np.array(np.broadcast_to(initialTokens, (numFlows,)), dtype=np.float64)
+        self.lastTimes = np.zeros(numFlows) # Arrival time of each flow's last packet
+        self.packetCounts = np.zeros(numFlows, dtype=np.int64)
+        self.dropCounts = np.zeros(numFlows, dtype=np.int64)
+        self.byteCounts = np.zeros(numFlows) # Byte mode only
+        self.droppedBytes = np.zeros(numFlows)
+
+    def process(self, arrivalTimes, flowIds, pktLengths=None):
+        '''
+        Polices the next block of packets.
+
+        arrivalTimes: Absolute arrival time of each packet (non-decreasing,
+                      and after every packet of the previous blocks)
+        flowIds: Flow of each packet
+        pktLengths: Length of each packet, for byte mode
+
+        Returns a boolean array flagging each dropped packet.
+        '''
+        arrivalTimes = np.asarray(arrivalTimes, dtype=np.float64)
+        flowIds = np.asarray(flowIds, dtype=np.intp)
+        numPackets = arrivalTimes.shape[0]
+        if numPackets == 0:
+            return np.zeros(0, dtype=bool)
+
+        # Group the packets by flow, keeping each flow's packets in arrival order
+        order = np.argsort(flowIds, kind='stable')
+        counts = np.bincount(flowIds, minlength=self.numFlows)
+        runStarts = np.cumsum(counts) - counts
+        flows = np.flatnonzero(counts)
+        flows = flows[np.argsort(-counts[flows], kind='stable')] # Longest run first
+
+        times = arrivalTimes[order]
+        costs = None
+        if pktLengths is not None:
+            pktLengths = np.broadcast_to(np.asarray(pktLengths, dtype=np.float64), (numPackets,))
+            costs = pktLengths[order]
+        passed = np.empty(numPackets, dtype=bool) # In grouped order
+
+        numLong = np.count_nonzero(counts[flows] > LONG_RUN)
+        longFlows, flows = flows[:numLong], flows[numLong:]
+        self._scanRuns(longFlows, runStarts[longFlows], counts[longFlows], times, costs, passed)
+        self._lockstepRuns(flows, runStarts[flows], counts[flows], times, costs, passed)
+
+        dropped = np.empty(numPackets, dtype=bool)
+        dropped[order] = ~passed
+        self.packetCounts += counts
+        self.dropCounts += np.bincount(flowIds[dropped], minlength=self.numFlows)
+        if pktLengths is not None:
+            self.byteCounts += np.bincount(flowIds, weights=pktLengths, minlength=self.numFlows)
+            self.droppedBytes += np.bincount(flowIds[dropped], weights=pktLengths[dropped], minlength=self.numFlows)
+        return dropped
+
+    def _scanRuns(self, flows, runStarts, runLengths, times, costs, passed):
+        # Long runs, cut into blocks of SCAN_BLOCK_SIZE packets and scanned together. Each
+        # run is padded to whole blocks with packets that leave the bucket as it is
+        # (no new tokens, infinite cost).
+        if flows.shape[0] == 0:
+            return
+        blocksPerRun = -(-runLengths // SCAN_BLOCK_SIZE)
+        firstBlocks = np.cumsum(blocksPerRun) - blocksPerRun
+        runOfBlock = np.repeat(np.arange(flows.shape[0]), blocksPerRun)
+        offsets = (np.arange(runOfBlock.shape[0]) - firstBlocks[runOfBlock]) * SCAN_BLOCK_SIZE + \
+                  np.arange(SCAN_BLOCK_SIZE)[:, np.newaxis] # (position in block x block) offset in run
+        valid = offsets < runLengths[runOfBlock]
+        index = np.where(valid, runStarts[runOfBlock] + offsets, 0)
+
+        prevTimes = np.where(offsets == 0, self.lastTimes[flows][runOfBlock], times[index - 1])
+        newTokens = np.where(valid, self.tokenRates[flows][runOfBlock] * (times[index] - prevTimes), 0.0)
+        blockCosts = np.where(valid, 1.0 if costs is None else costs[index], np.inf)
+
+        # A run's first block starts from the flow's bucket; all others follow on
+        follows = np.ones(runOfBlock.shape[0], dtype=bool)
+        follows[firstBlocks] = False
+        follows = np.flatnonzero(follows)
+
+        def lockstep(blockInputs, startStates):
+            dropped, endTokens = _policerLockstep(blockInputs[0], startStates[0], blockInputs[2], blockInputs[1])
+            return dropped, [endTokens]
+
+        def sequential(blockInputs, startStates):
+            dropped, endTokens = _policerSequential(blockInputs[0], startStates[0], blockInputs[2], blockInputs[1])
+            return dropped, [endTokens]
+
+        dropped, endStates = _scanBlocks(lockstep, [newTokens, blockCosts, self.bucketSizes[flows][runOfBlock]],
+                                         [self.numTokens[flows][runOfBlock]], follows, sequential=sequential)
+        passed[index[valid]] = ~dropped[valid]
+        self.numTokens[flows] = endStates[0][firstBlocks + blocksPerRun - 1]
+        self.lastTimes[flows] = times[runStarts + runLengths - 1]
+
+    def _lockstepRuns(self, flows, runStarts, runLengths, times, costs, passed):
+        # Runs sorted by decreasing length: step k covers the first numActive[k] flows
+        if flows.shape[0] == 0:
+            return
+        numActive = np.searchsorted(-runLengths, -np.arange(runLengths[0]), side='left')
+        numTokens = self.numTokens[flows]
+        lastTimes = self.lastTimes[flows]
+        tokenRates = self.tokenRates[flows]
+        bucketSizes = self.bucketSizes[flows]
+        newTokens = np.empty(flows.shape[0])
+        passing = np.empty(flows.shape[0], dtype=bool)
+
+        for k, n in enumerate(numActive.tolist()):
+            index = runStarts[:n] + k
+            now = times[index]
+            tokens = numTokens[:n]
+            np.subtract(now, lastTimes[:n], out=newTokens[:n])
+            np.multiply(tokenRates[:n], newTokens[:n], out=newTokens[:n])
+            np.add(tokens, newTokens[:n], out=tokens)
+            np.minimum(tokens, bucketSizes[:n], out=tokens)
+            cost = 1 if costs is None else costs[index]
+            np.greater_equal(tokens, cost, out=passing[:n])
+            np.subtract(tokens, cost, out=tokens, where=passing[:n])
+            lastTimes[:n] = now
+            passed[index] = passing[:n]
+
+        self.numTokens[flows] = numTokens
+        self.lastTimes[flows] = lastTimes
+
+
+def streamFlowPolicer(sampleBlock, numPackets, policer, blockSize=FLOW_BLOCK_SIZE):
+    '''
+    Feeds numPackets packets through a FlowPolicer, blockSize at a time.
+
+    sampleBlock: Function taking (offset, n) and returning a tuple
+                 (interArrivals, flowIds, pktLengths) for packets offset ...
+                 offset + n - 1 (pktLengths is None outside byte mode)
+
+    Returns the policer, whose tables hold the per-flow counts.
+    '''
+    clock = 0.0
+    offset = 0
+    while offset < numPackets:
+        n = min(blockSize, numPackets - offset)
+        interArrivals, flowIds, pktLengths = sampleBlock(offset, n)
+        arrivalTimes = np.cumsum(interArrivals)
+        arrivalTimes += clock
+        policer.process(arrivalTimes, flowIds, pktLengths)
+        clock = arrivalTimes[-1]
+        offset += n
+    return policer
+
+
+def flowPolicerDrops(arrivalTimes, flowIds, numFlows, tokenRate, bucketSize, initialTokens=0.0,
+                     pktLengths=None, blockSize=FLOW_BLOCK_SIZE):
+    '''
+    Polices a whole interleaved stream held in memory (see FlowPolicer for
+    the arguments).
+
+    Returns (dropCounts, dropped): the number of drops of each flow, and a
+    boolean array flagging each dropped packet.
+    '''
+    policer = FlowPolicer(numFlows, tokenRate, bucketSize, initialTokens)
+    dropped = np.empty(len(arrivalTimes), dtype=bool)
+    for start in range(0, len(arrivalTimes), blockSize):
+        block = slice(start, start + blockSize)
+        dropped[block] = policer.process(arrivalTimes[block], flowIds[block],
+                                         None if pktLengths is None else pktLengths[block])
+    return policer.dropCounts, dropped
@@ -0,0 +1,156 @@
+'''
+Goodness-of-fit scores of simulated wait times against a theoretical CDF.
+
+Both scores work on the probability integral transform u = F(x) of the sorted
+samples, so everything is one sort plus vectorized passes (O(N log N)):
+    Kolmogorov-Smirnov: D = max_i max( i / n - u(i), u(i) - (i - 1) / n )
+    Anderson-Darling: A^2 = -n - 1/n * sum_i (2i - 1) * (log u(i) + log(1 - u(n + 1 - i)))
+The queueing delay has an atom at 0 (P(W = 0) = 1 - rho), where the plain
+transform would pile every idle packet onto one value. Samples tied at a jump
+of F are spread evenly over [F(x-), F(x)] instead, which is what the
+continuous-case formulas expect. (The spread ties vary less than independent
+uniforms would, so with an atom the p-values below are somewhat conservative.)
+
+p-values use the asymptotic Kolmogorov distribution (with Stephens' small
+sample correction) and Marsaglia & Marsaglia's approximation of the limiting
+Anderson-Darling distribution. Both assume independent samples, while
+consecutive Lindley wait times are strongly correlated, so the p-values are
+far too small. With autocorrelated=True, the sample size is replaced by the
+effective sample size n / tau, where tau is the integrated autocorrelation
+time of the transformed series (FFT autocorrelation with Sokal's automatic
+window).
+'''
+import numpy as np
+
+SOKAL_WINDOW = 5 # Sum autocorrelations up to lag M, the smallest M >= SOKAL_WINDOW * tau(M)
+
+
+def probabilityTransform(samples, cdf):
+    '''
+    Probability integral transform of samples, with ties at jumps of the CDF
+    spread evenly over the jump.
+
+    samples: Sample values
+    cdf: Vectorized theoretical CDF (callable, F(t) = 0 for t < 0 is fine)
+
+    Returns (u, order): the sorted transformed values and the permutation
+    that sorts samples (u[k] belongs to samples[order[k]]).
+    '''
+    samples = np.asarray(samples, dtype=np.float64).reshape(-1)
+    order = np.argsort(samples, kind='stable')
+    sortedSamples = samples[order]
+
+    values, first, counts = np.unique(sortedSamples, return_index=True, return_counts=True)
+    upper = np.asarray(cdf(values), dtype=np.float64)
+    lower = np.asarray(cdf(np.nextafter(values, -np.inf)), dtype=np.float64) # F(x-)
+
+    # j-th of c tied samples goes to F(x-) + (F(x) - F(x-)) * (j - 0.5) / c
+    group = np.repeat(np.arange(len(values)), counts)
+    rank = np.arange(len(samples)) - first[group] + 0.5
+    u = lower[group] + (upper - lower)[group] * rank / counts[group]
+    return u, order
+
+
+def ksStatistic(u):
+    '''Kolmogorov-Smirnov distance of sorted transformed values from uniform.'''
+    n = len(u)
+    ranks = np.arange(1, n + 1)
+    return max(np.max(ranks / float(n) - u), np.max(u - (ranks - 1) / float(n)))
+
+
+def adStatistic(u):
+    '''Anderson-Darling statistic of sorted transformed values.'''
+    n = len(u)
+    eps = np.finfo(np.float64).eps
+    u = np.clip(u, np.finfo(np.float64).tiny, 1 - eps / 2)
+    weights = 2 * np.arange(1, n + 1) - 1
+    return -n - np.dot(weights, np.log(u) + np.log1p(-u[::-1])) / n
+
+
+def ksPValue(distance, n):
+    '''
+    P(D > distance) for n independent samples (asymptotic Kolmogorov
+    distribution with Stephens' correction).
+    '''
+    root = np.sqrt(n)
+    x = (root + 0.12 + 0.11 / root) * distance
+    if x < 1e-3:
+        return 1.0
+    k = np.arange(1, 101)
+    if x < 1.18:
+        # P(K <= x) = sqrt(2 pi) / x * sum_k exp(-(2k - 1)^2 pi^2 / (8 x^2)), fast for small x
+        cdf = np.sqrt(2 * np.pi) / x * np.sum(np.exp(-(2 * k - 1)**2 * np.pi**2 / (8 * x**2)))
+        return float(min(max(1 - cdf, 0.0), 1.0))
+    return float(min(max(2 * np.sum((-1.0)**(k - 1) * np.exp(-2 * k**2 * x**2)), 0.0), 1.0))
+
+
+def adPValue(statistic):
+    '''
+    P(A^2 > statistic) under the limiting Anderson-Darling distribution
+    (Marsaglia & Marsaglia, 2004).
+    '''
+    z = float(statistic)
+    if z <= 0:
+        return 1.0
+    if z < 2:
+        cdf = np.exp(-1.2337141 / z) / np.sqrt(z) * (2.00012 + (0.247105 - (0.0649821 - (0.0347962
+                - (0.011672 - 0.00168691 * z) * z) * z) * z) * z)
+    else:
+        cdf = np.exp(-np.exp(1.0776 - (2.30695 - (0.43424 - (0.082433 - (0.008056
+                - 0.0003146 * z) * z) * z) * z) * z))
+    return float(min(max(1 - cdf, 0.0), 1.0))
+
+
+def autocorrTime(series):
+    '''
+    Integrated autocorrelation time tau = 1 + 2 * sum_{k=1..M} rho(k) of a
+    series, from its FFT autocorrelation with Sokal's automatic window.
+    '''
+    series = np.asarray(series, dtype=np.float64)
+    n = len(series)
+    centered = series - series.mean()
+    fftLength = 1 << int(2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(centered, fftLength)
+    acov = np.fft.irfft(spectrum * np.conj(spectrum), fftLength)[:n]
+    if acov[0] <= 0:
+        return 1.0
+    taus = 2 * np.cumsum(acov / acov[0]) - 1 # tau(M) for M = 0, 1, ...
+    window = np.flatnonzero(np.arange(n) >= SOKAL_WINDOW * taus)
+    tau = taus[window[0]] if len(window) > 0 else taus[-1]
+    return float(max(tau, 1.0))
+
+
+def goodnessOfFit(samples, cdf, autocorrelated=False):
+    '''
+    Scores samples against a theoretical CDF.
+
+    samples: Sample values, in the order they were generated
+    cdf: Vectorized theoretical CDF (callable)
+    autocorrelated: Base the p-values on the effective sample size
+
+    Returns a dict (JSON-serializable) with the number of samples 'n', the
+    statistics 'ks' & 'ad', their p-values 'ksPValue' & 'adPValue', the
+    'effectiveN' they are based on and the 'autocorrTime' (1 when not
+    autocorrelated).
+    '''
+    u, order = probabilityTransform(samples, cdf)
+    n = len(u)
+    ks = ksStatistic(u)
+    ad = adStatistic(u)
+
+    tau = 1.0
+    if autocorrelated:
+        inOrder = np.empty(n)
+        inOrder[order] = u
+        tau = autocorrTime(inOrder)
+    effectiveN = n / tau
+
+    return {
+        'n': n,
+        'ks': float(ks),
+        'ad': float(ad),
+        'ksPValue': ksPValue(ks, effectiveN),
+        'adPValue': adPValue(ad * effectiveN / n), # A^2 scales with the sample size
+        'effectiveN': float(effectiveN),
+        'autocorrTime': tau,
+    }
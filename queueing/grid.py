@@ -0,0 +1,173 @@
+'''
+Runs one simulation per point of a parameter grid across a process pool.
+
+Where sweep.py reuses one set of random numbers for every load level of a
+single model, this runs each grid point as an independent simulation (see
+simulate.py), e.g. arrRate x servRate for M/M/1 or tokenRate x bucketSize
+for the token buckets. Point k gets its own seed, child k of the sweep's
+SeedSequence, so points are independent and any one of them can be re-run
+on its own:
+
+    seedSequence(seed).spawn(numPoints)[k]
+
+Points are handed to the workers in chunks (several per worker, so cheap
+and expensive points even out), each point is reduced to a few statistics
+in the worker, and the statistics are collected into one columnar result: a
+NumPy structured array with one field per grid axis and per statistic.
+'''
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .parallel import _poolContext
+from .replications import waitStats
+from .rng import seedSequence
+from .simulate import simulateMM1, simulateMD1, simulateMultiplexer, \
+                      simulateTokenBucket, simulatePolicer, simulateMarker, simulateFlowPolicer
+from .marker import COLOR_NAMES
+
+CHUNKS_PER_WORKER = 4 # Chunks of points handed to each worker (load balancing)
+
+
+def _queueStats(run):
+    stats = waitStats(run.waitTimes[np.newaxis])
+    stats['probWait'] = np.count_nonzero(run.waitTimes) / float(len(run.waitTimes))
+    return stats
+
+
+def _shaperStats(run):
+    return waitStats((run.departEmpEnv - run.arrEmpEnv)[np.newaxis])
+
+
+def _policerStats(run):
+    dropCount = np.count_nonzero(run.dropped)
+    return {'dropCount': dropCount, 'dropRate': dropCount / float(len(run.dropped))}
+
+
+def _flowPolicerStats(run):
+    active = run.packetCounts > 0
+    flowDropRates = run.dropCounts[active] / run.packetCounts[active].astype(np.float64)
+    return {'dropCount': run.dropCounts.sum(), 'dropRate': run.dropCounts.sum() / float(run.packetCounts.sum()),
+            'meanFlowDropRate': flowDropRates.mean(), 'maxFlowDropRate': flowDropRates.max()}
+
+
+def _markerStats(run):
+    fractions = np.bincount(run.colors, minlength=len(COLOR_NAMES)) / float(len(run.colors))
+    return dict((name + 'Fraction', fractions[color]) for color, name in enumerate(COLOR_NAMES))
+
+
+# Model name: (simulation function, function reducing its result to statistics)
+MODELS = {
+    'mm1': (simulateMM1, _queueStats),
+    'md1': (simulateMD1, _queueStats),
+    'multiplexer': (simulateMultiplexer, _queueStats),
+    'token-bucket': (simulateTokenBucket, _shaperStats),
+    'policer': (simulatePolicer, _policerStats),
+    'marker': (simulateMarker, _markerStats),
+    'flow-policer': (simulateFlowPolicer, _flowPolicerStats),
+}
+
+
+def parameterGrid(**axes):
+    '''
+    Cartesian product of parameter values, e.g.
+    parameterGrid(tokenRate=[300, 350], bucketSize=range(1, 11)).
+
+    Returns a dict of equal-length arrays (one entry per point, the last axis
+    varying fastest).
+    '''
+    names = list(axes)
+    points = list(itertools.product(*[np.atleast_1d(axes[name]).tolist() for name in names]))
+    return {name: np.array([point[i] for point in points]) for i, name in enumerate(names)}
+
+
+def _runPoint(model, numPackets, fixed, point, seed):
+    simulate, reduceStats = MODELS[model]
+    run = simulate(numPackets, seed=seed, **dict(fixed, **point))
+    return dict((name, np.asarray(value).reshape(-1)[0]) for name, value in reduceStats(run).items())
+
+
+def gridSweep(model, grid, numPackets, seed=None, numWorkers=None, **fixed):
+    '''
+    Simulates a model once per grid point, spread over a process pool.
+
+    model: One of MODELS ('mm1', 'md1', 'multiplexer', 'token-bucket',
+           'policer', 'marker', 'flow-policer')
+    grid: Dict of equal-length arrays, one per swept parameter (see
+          parameterGrid); names are those of the simulate* function
+    numPackets: Number of packets simulated at every point
+    seed: Integer seed or SeedSequence for the whole sweep
+    numWorkers: Number of worker processes (default: number of CPUs)
+    fixed: Parameters shared by every point (e.g. servRate=1)
+
+    Returns a structured array with one record per point: the grid
+    parameters followed by the point's statistics (meanWait, maxWait,
+    p99Wait & probWait for the queues, the delay stats for the shaper,
+    dropCount & dropRate for the policer, plus the mean & max drop rate of
+    the flows for the flow policer, the fraction of each color for the
+    marker).
+    '''
+    names = list(grid)
+    columns = [np.asarray(grid[name]) for name in names]
+    numPoints = len(columns[0]) if columns else 1
+    points = [dict((name, column[k].item()) for name, column in zip(names, columns))
+              for k in range(numPoints)]
+    seeds = seedSequence(seed).spawn(numPoints)
+
+    numWorkers = min(numWorkers or os.cpu_count() or 1, numPoints)
+    args = ([model] * numPoints, [numPackets] * numPoints, [fixed] * numPoints, points, seeds)
+    if numWorkers == 1:
+        stats = list(map(_runPoint, *args))
+    else:
+        chunkSize = max(1, numPoints // (numWorkers * CHUNKS_PER_WORKER))
+        with ProcessPoolExecutor(numWorkers, mp_context=_poolContext()) as pool:
+            stats = list(pool.map(_runPoint, *args, chunksize=chunkSize))
+
+    statNames = list(stats[0])
+    dtype = [(name, column.dtype) for name, column in zip(names, columns)] + \
+            [(name, np.asarray(stats[0][name]).dtype) for name in statNames]
+    results = np.empty(numPoints, dtype=dtype)
+    for name, column in zip(names, columns):
+        results[name] = column
+    for name in statNames:
+        results[name] = [pointStats[name] for pointStats in stats]
+    return results
+
+
+def saveSweep(path, results):
+    '''
+    Writes a sweep result as CSV (path ending in .csv, one column per field)
+    or as a .npy file that np.load reads back as the same structured array.
+    '''
+    if str(path).endswith('.csv'):
+        np.savetxt(path, results, delimiter=',', header=','.join(results.dtype.names), comments='',
+                   fmt=['%d' if results.dtype[name].kind in 'iub' else '%.17g' for name in results.dtype.names])
+    else:
+        np.save(path, results)
+
+
+def plotSweep(results, x, y, by=None, ax=None):
+    '''
+    Plots statistic y against parameter x, one curve per value of parameter
+    by (if given). matplotlib is only imported when this is called.
+
+    Returns the matplotlib Axes.
+    '''
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.figure(figsize=(10, 8)).add_subplot(111)
+
+    groups = [None] if by is None else np.unique(results[by])
+    for value in groups:
+        curve = results if value is None else results[results[by] == value]
+        curve = curve[np.argsort(curve[x], kind='stable')]
+        label = y if value is None else "%s = %g" % (by, value)
+        ax.plot(curve[x], curve[y], 'o-', label=label, linewidth=2.0)
+
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.legend(loc='best')
+    ax.grid(True)
+    return ax
@@ -0,0 +1,152 @@
+'''
+Vectorized Lindley recursion shared by the Wait-Times demos.
+
+Lindley's equation: W(n) = max(0, W(n - 1) + serviceTime(n - 1) - interArrivalTime(n))
+
+Unrolling the recursion gives the reflected random walk
+    W(n) = C(n) - min(-W(0), C(1), ..., C(n))
+where C(n) = sum_{i=1..n} (serviceTime(i - 1) - interArrivalTime(i)).
+The partial sums and the running minimum are both single NumPy passes, so the
+whole waitTimes array is computed without a Python-level loop.
+
+The random walk is restarted every blockSize packets (carrying the last wait
+time across), which keeps the partial sums small and the rounding error of
+the cumulative sum bounded regardless of the number of packets. Blocks are
+always counted from the start of the run, so a run split at block boundaries
+(across chunks or worker processes) gives bit-for-bit the same wait times.
+'''
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 2**16
+
+
+def lindley(interArrivals, serviceTimes, initialWait=0.0,
+            blockSize=DEFAULT_BLOCK_SIZE, out=None):
+    '''
+    Computes the wait time of every packet using Lindley's equation.
+
+    interArrivals: Inter-arrival time of each packet. A 2-D (R x N) array is
+                   treated as R independent sample paths, one per row.
+    serviceTimes: Service time of each packet (array broadcastable to
+                  interArrivals, or a scalar for a constant service time)
+    initialWait: Wait time of the first packet (scalar, or one per row)
+    blockSize: Number of packets per vectorized pass
+    out: Optional preallocated float64 array to store the result in
+
+    Returns a float64 array of wait times shaped like interArrivals.
+    '''
+    interArrivals = np.asarray(interArrivals, dtype=np.float64)
+    serviceTimes = np.broadcast_to(np.asarray(serviceTimes, dtype=np.float64),
+                                   interArrivals.shape)
+
+    waitTimes = np.empty(interArrivals.shape) if out is None else out
+    if interArrivals.shape[-1] == 0:
+        return waitTimes
+
+    waitTimes[..., 0] = initialWait
+    lindleyContinue(interArrivals[..., 1:], serviceTimes[..., 1:],
+                    waitTimes[..., 0], serviceTimes[..., 0],
+                    blockSize, out=waitTimes[..., 1:])
+    return waitTimes
+
+
+def lindleyContinue(interArrivals, serviceTimes, prevWait, prevService,
+                    blockSize=DEFAULT_BLOCK_SIZE, out=None):
+    '''
+    Continues Lindley's equation from a known previous packet, i.e. computes
+    the wait times of a run of packets that directly follows a packet with
+    wait time prevWait and service time prevService.
+
+    interArrivals: Inter-arrival time of each packet in the run (2-D input is
+                   treated as independent rows)
+    serviceTimes: Service time of each packet in the run (or a scalar)
+    prevWait, prevService: Wait & service time of the packet just before the
+                           run (scalars, or one per row)
+
+    Returns a float64 array of wait times shaped like interArrivals.
+    '''
+    interArrivals = np.asarray(interArrivals, dtype=np.float64)
+    numPackets = interArrivals.shape[-1]
+    rows = interArrivals.shape[:-1]
+    serviceTimes = np.broadcast_to(np.asarray(serviceTimes, dtype=np.float64),
+                                   interArrivals.shape)
+    prevWait = np.broadcast_to(np.asarray(prevWait, dtype=np.float64), rows)[..., np.newaxis]
+    prevService = np.broadcast_to(np.asarray(prevService, dtype=np.float64), rows)[..., np.newaxis]
+
+    waitTimes = np.empty(interArrivals.shape) if out is None else out
+    walk = np.empty(rows + (min(blockSize, numPackets),))
+
+    for start in range(0, numPackets, blockSize):
+        end = min(start + blockSize, numPackets)
+        steps = walk[..., :end - start]
+        block = waitTimes[..., start:end]
+
+        # C(n) for this block (each step uses the service time of the previous packet),
+        # relative to the last wait of the previous block
+        np.subtract(prevService, interArrivals[..., start:start + 1], out=steps[..., :1])
+        np.subtract(serviceTimes[..., start:end - 1], interArrivals[..., start + 1:end], out=steps[..., 1:])
+        np.cumsum(steps, axis=-1, out=steps)
+
+        # W(n) = C(n) - min(-W(start - 1), running min of C)
+        np.minimum.accumulate(steps, axis=-1, out=block)
+        np.minimum(block, -prevWait, out=block)
+        np.subtract(steps, block, out=block)
+
+        prevWait = block[..., -1:]
+        prevService = serviceTimes[..., end - 1:end]
+
+    return waitTimes
+
+
+def lindleyBlockSums(interArrivals, serviceTimes, prevService, blockSize=DEFAULT_BLOCK_SIZE):
+    '''
+    Reduces a run of packets to one summary per block (as cut by
+    lindleyContinue). The Lindley steps of a block compose to the map
+        x -> max(lastSum - minSum, x + lastSum)
+    where lastSum and minSum are the last and the smallest partial sum C(n)
+    of the block. See lindleyCarry for applying them.
+
+    interArrivals: Inter-arrival time of each packet in the run
+    serviceTimes: Service time of each packet in the run (or a scalar)
+    prevService: Service time of the packet just before the run
+
+    Returns the arrays (lastSums, minSums), one entry per block.
+    '''
+    interArrivals = np.asarray(interArrivals, dtype=np.float64)
+    numPackets = interArrivals.shape[0]
+    serviceTimes = np.broadcast_to(np.asarray(serviceTimes, dtype=np.float64),
+                                   interArrivals.shape)
+
+    numBlocks = -(-numPackets // blockSize)
+    lastSums = np.empty(numBlocks)
+    minSums = np.empty(numBlocks)
+    steps = np.empty(min(blockSize, numPackets))
+
+    for k, start in enumerate(range(0, numPackets, blockSize)):
+        end = min(start + blockSize, numPackets)
+        blockSteps = steps[:end - start]
+
+        np.subtract(prevService, interArrivals[start], out=blockSteps[:1])
+        np.subtract(serviceTimes[start:end - 1], interArrivals[start + 1:end], out=blockSteps[1:])
+        np.cumsum(blockSteps, out=blockSteps)
+
+        lastSums[k] = blockSteps[-1]
+        minSums[k] = blockSteps.min()
+        prevService = serviceTimes[end - 1]
+
+    return lastSums, minSums
+
+
+def lindleyCarry(lastSums, minSums, prevWait):
+    '''
+    Applies block summaries (see lindleyBlockSums) one after the other,
+    starting from the wait time prevWait.
+
+    Returns the wait time of the last packet of every block. This uses the
+    same float operations as lindleyContinue, so the results are identical.
+    '''
+    waits = np.empty(len(lastSums))
+    for k in range(len(lastSums)):
+        prevWait = lastSums[k] - min(minSums[k], -prevWait)
+        waits[k] = prevWait
+    return waits
@@ -0,0 +1,101 @@
+'''
+Summary statistics for the headless (metricsOnly) mode of the demos.
+
+Statistics are collected in plain dicts and printMetrics() writes them as a
+single JSON document, so automated runs can parse a script's output instead
+of looking at figures. Nothing here imports matplotlib.
+'''
+import json
+import sys
+
+import numpy as np
+
+from .ecdf import quantiles
+from .occupancy import occupancyDistribution, littlesLaw
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.99)
+
+
+def _percentileName(p):
+    return 'p%s' % ('%g' % p).replace('.', '_') # 99.99 -> p99_99
+
+
+def sampleMetrics(samples, percentiles=DEFAULT_PERCENTILES):
+    '''
+    Count, mean, standard deviation, min, max and exact percentiles of a
+    sample (e.g. the wait time of every packet). An empty sample has count 0
+    and NaN for everything else.
+    '''
+    samples = np.asarray(samples, dtype=np.float64)
+    values = quantiles(samples, np.divide(percentiles, 100.0))
+    if samples.shape[0] == 0:
+        nan = float('nan')
+        metrics = {'count': 0, 'mean': nan, 'std': nan, 'min': nan, 'max': nan}
+    else:
+        metrics = {
+            'count': int(samples.shape[0]),
+            'mean': float(samples.mean()),
+            'std': float(samples.std(ddof=1)) if samples.shape[0] > 1 else 0.0,
+            'min': float(samples.min()),
+            'max': float(samples.max()),
+        }
+    for p, value in zip(percentiles, values):
+        metrics[_percentileName(p)] = float(value)
+    return metrics
+
+
+def streamMetrics(waitStats, waitHist, percentiles=DEFAULT_PERCENTILES):
+    '''
+    Same fields as sampleMetrics, from the running statistics of a streamed
+    run (percentiles are upper bounds, to within one histogram bin).
+    '''
+    metrics = {
+        'count': int(waitStats.count),
+        'mean': float(waitStats.mean),
+        'std': float(np.sqrt(waitStats.variance)),
+        'min': float(waitStats.min),
+        'max': float(waitStats.max),
+    }
+    for p in percentiles:
+        metrics[_percentileName(p)] = float(waitHist.quantile(p / 100.0))
+    return metrics
+
+
+def systemMetrics(arrEmpEnv, departEmpEnv):
+    '''
+    Time-weighted packets-in-system statistics and Little's law check (up to
+    the last arrival) for the given arrival & departure times.
+    '''
+    occupancyProbs, meanOccupancy = occupancyDistribution(arrEmpEnv, departEmpEnv)
+    little = littlesLaw(arrEmpEnv, departEmpEnv, end=arrEmpEnv[-1])
+    return {
+        'meanOccupancy': float(meanOccupancy),
+        'maxOccupancy': len(occupancyProbs) - 1,
+        'littlesLaw': dict((name, float(value)) for name, value in little.items()),
+    }
+
+
+def summaryMetrics(summary):
+    '''
+    Replication summary (see replications.summarize) as nested dicts.
+    '''
+    return dict((name, dict((field, float(value)) for field, value in ci._asdict().items()))
+                for name, ci in summary.items())
+
+
+def _toJson(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Cannot serialize %r" % (value,))
+
+
+def printMetrics(metrics, stream=None):
+    '''
+    Writes metrics as one JSON document (NumPy values are converted).
+    '''
+    stream = sys.stdout if stream is None else stream
+    json.dump(metrics, stream, indent=4, default=_toJson)
+    stream.write('\n')
+    stream.flush()
@@ -0,0 +1,99 @@
+'''
+Packets in system (backlog) analysis shared by the demos.
+
+Logically, PacketsInSystem(t) = ArrivalEmpEnv(t) - DepartureEmpEnv(t), where
+each envelope counts the events at or before time t. With the arrival and
+departure times sorted, both counts are binary searches (np.searchsorted), so
+the exact backlog at any set of times costs O(log N) per time.
+'''
+import numpy as np
+
+
+def backlogSeries(arrEmpEnv, departEmpEnv, times):
+    '''
+    Returns the exact number of packets in system at each of the given times.
+
+    arrEmpEnv: Sorted arrival times
+    departEmpEnv: Sorted departure times
+    times: Times to sample the backlog at (any resolution, any order)
+    '''
+    times = np.asarray(times, dtype=np.float64)
+    numArrivals = np.searchsorted(arrEmpEnv, times, side='right')
+    numDepartures = np.searchsorted(departEmpEnv, times, side='right')
+    return numArrivals - numDepartures
+
+
+def mergeEvents(arrEmpEnv, departEmpEnv):
+    '''
+    Merges the sorted arrival and departure times into one sorted event
+    stream (an arrival at the same time as a departure comes first, since a
+    packet may leave at the very time it arrives).
+
+    Returns (times, numInSystem) where numInSystem[i] is the number of
+    packets in system right after event i.
+    '''
+    arrEmpEnv = np.asarray(arrEmpEnv, dtype=np.float64)
+    departEmpEnv = np.asarray(departEmpEnv, dtype=np.float64)
+
+    # Position of each event in the merged stream = own index + number of
+    # events of the other kind that come before it
+    arrPos = np.arange(arrEmpEnv.shape[0]) + np.searchsorted(departEmpEnv, arrEmpEnv, side='left')
+    departPos = np.arange(departEmpEnv.shape[0]) + np.searchsorted(arrEmpEnv, departEmpEnv, side='right')
+
+    numEvents = arrEmpEnv.shape[0] + departEmpEnv.shape[0]
+    times = np.empty(numEvents)
+    steps = np.empty(numEvents, dtype=np.int64)
+    times[arrPos] = arrEmpEnv
+    times[departPos] = departEmpEnv
+    steps[arrPos] = 1
+    steps[departPos] = -1
+
+    return times, np.cumsum(steps)
+
+
+def occupancyDistribution(arrEmpEnv, departEmpEnv, start=0.0, end=None):
+    '''
+    Exact time-weighted distribution of the number of packets in system over
+    the window [start, end] (default end: last departure).
+
+    Returns (probs, meanOccupancy) where probs[k] = P(N = k), i.e. the
+    fraction of the window during which exactly k packets were in system.
+    '''
+    times, numInSystem = mergeEvents(arrEmpEnv, departEmpEnv)
+    end = times[-1] if end is None else end
+
+    # Time spent in each state: from one event to the next, clipped to the window.
+    # Before the first event the system is empty.
+    np.clip(times, start, end, out=times)
+    durations = np.diff(times, append=end)
+    emptyTime = times[0] - start
+
+    timeInState = np.bincount(numInSystem, weights=durations)
+    timeInState[0] += emptyTime
+    probs = timeInState / (end - start)
+
+    return probs, np.dot(np.arange(probs.shape[0]), probs)
+
+
+def littlesLaw(arrEmpEnv, departEmpEnv, start=0.0, end=None):
+    '''
+    Compares the time-average number in system L with lambda * W, where
+    lambda is the arrival rate over the window and W the mean time in system
+    of the packets (departure - arrival).
+
+    Over a window that contains every arrival and departure the two are equal
+    up to rounding; over a shorter window the gap shows edge effects (packets
+    still in system when the window closes).
+
+    Returns a dict with L, lambda, W and the gap L - lambda * W.
+    '''
+    arrEmpEnv = np.asarray(arrEmpEnv, dtype=np.float64)
+    departEmpEnv = np.asarray(departEmpEnv, dtype=np.float64)
+    end = departEmpEnv.max() if end is None else end
+
+    _, L = occupancyDistribution(arrEmpEnv, departEmpEnv, start, end)
+    numArrivals = np.searchsorted(arrEmpEnv, end, side='right') - np.searchsorted(arrEmpEnv, start, side='left')
+    arrRate = numArrivals / (end - start)
+    W = np.mean(departEmpEnv - arrEmpEnv)
+
+    return {'L': L, 'lambda': arrRate, 'W': W, 'gap': L - arrRate * W}
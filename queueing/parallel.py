@@ -0,0 +1,191 @@
+'''
+Multi-core Lindley engine for a single very long sample path.
+
+Lindley's equation is a max-plus prefix scan: each step is x -> max(0, x + b)
+and the composition of such maps is x -> max(a, x + b). The path is split
+into one segment per worker and computed in three phases:
+    1. Every worker reduces its segment to one (a, b) map per Lindley block
+       (in parallel, see lindley.lindleyBlockSums)
+    2. A sequential pass over the block maps gives the wait time of the
+       packet right before each segment (cheap: one step per block)
+    3. Every worker runs the Lindley engine over its own segment, starting
+       from that wait time (in parallel)
+
+Segments start on Lindley block boundaries and phase 2 uses the same float
+operations as the engine itself, so the wait times are bit-for-bit those of
+the single-core engine, whatever the number of workers.
+
+Workers get their inputs from a sampler: a picklable function returning the
+(interArrivals, serviceTimes) of any packet range [start, end). Inputs that
+already exist are shared with the workers through shared memory; inputs can
+also be generated inside the workers (e.g. with rng.PacketSampler), in which
+case the path never has to exist in one place. Each worker processes its
+segment chunk by chunk, so its memory use doesn't grow with the path length.
+
+Note: The demos run at module level, so the "fork" start method is used
+where available; with "spawn" every worker would re-run the calling script.
+'''
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .lindley import DEFAULT_BLOCK_SIZE, lindley, lindleyContinue, lindleyBlockSums, lindleyCarry
+
+# Lindley blocks per chunk processed by a worker at a time
+CHUNK_BLOCKS = 16
+
+
+def _poolContext():
+    if 'fork' in mp.get_all_start_methods():
+        return mp.get_context('fork')
+    return mp.get_context()
+
+
+class _SharedSampler(object):
+    '''
+    Sampler reading the inputs of a packet range from shared memory.
+    '''
+    def __init__(self, arrName, servName, servValue, numPackets):
+        self.arrName = arrName
+        self.servName = servName
+        self.servValue = servValue
+        self.numPackets = numPackets
+
+    def _read(self, name, start, end):
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return np.ndarray((self.numPackets,), dtype=np.float64, buffer=shm.buf)[start:end].copy()
+        finally:
+            shm.close()
+
+    def __call__(self, start, end):
+        interArrivals = self._read(self.arrName, start, end)
+        if self.servName is None:
+            return interArrivals, self.servValue
+        return interArrivals, self._read(self.servName, start, end)
+
+
+def _chunks(start, end, blockSize):
+    chunkSize = CHUNK_BLOCKS * blockSize
+    for chunkStart in range(start, end, chunkSize):
+        yield chunkStart, min(chunkStart + chunkSize, end)
+
+
+def _segmentBlockSums(sampleSegment, start, end, blockSize):
+    lastSums, minSums = [], []
+    for chunkStart, chunkEnd in _chunks(start, end, blockSize):
+        # Also sample the packet before the chunk for its service time
+        interArrivals, serviceTimes = sampleSegment(chunkStart - 1, chunkEnd)
+        serviceTimes = np.broadcast_to(serviceTimes, interArrivals.shape)
+        sums = lindleyBlockSums(interArrivals[1:], serviceTimes[1:], serviceTimes[0], blockSize)
+        lastSums.append(sums[0])
+        minSums.append(sums[1])
+    return np.concatenate(lastSums), np.concatenate(minSums)
+
+
+def _segmentWaits(sampleSegment, waitName, numPackets, start, end, prevWait, blockSize):
+    shm = shared_memory.SharedMemory(name=waitName)
+    try:
+        waitTimes = np.ndarray((numPackets,), dtype=np.float64, buffer=shm.buf)
+        for chunkStart, chunkEnd in _chunks(start, end, blockSize):
+            interArrivals, serviceTimes = sampleSegment(chunkStart - 1, chunkEnd)
+            serviceTimes = np.broadcast_to(serviceTimes, interArrivals.shape)
+            lindleyContinue(interArrivals[1:], serviceTimes[1:], prevWait, serviceTimes[0],
+                            blockSize, out=waitTimes[chunkStart:chunkEnd])
+            prevWait = waitTimes[chunkEnd - 1]
+    finally:
+        shm.close()
+
+
+def parallelLindleySampled(sampleSegment, numPackets, numWorkers=None,
+                           blockSize=DEFAULT_BLOCK_SIZE):
+    '''
+    Computes the wait time of every packet using Lindley's equation, with
+    each worker process sampling and simulating its own segment of the path.
+
+    sampleSegment: Picklable function taking (start, end) and returning the
+                   (interArrivals, serviceTimes) of packets start..end-1
+                   (serviceTimes may be a scalar for a constant service time)
+    numPackets: Total number of packets
+    numWorkers: Number of worker processes (default: number of CPUs)
+
+    Returns a float64 array of wait times, one per packet.
+    '''
+    numWorkers = numWorkers or os.cpu_count() or 1
+    numBlocks = -(-(numPackets - 1) // blockSize) if numPackets > 1 else 0
+
+    if numWorkers == 1 or numBlocks < 2:
+        interArrivals, serviceTimes = sampleSegment(0, numPackets)
+        return lindley(interArrivals, serviceTimes, blockSize=blockSize)
+    numWorkers = min(numWorkers, numBlocks)
+
+    # Packet 0 always waits 0; packets 1.. are split on block boundaries
+    blockBounds = np.linspace(0, numBlocks, numWorkers + 1).astype(np.int64)
+    bounds = np.minimum(1 + blockBounds * blockSize, numPackets)
+    segments = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    waitShm = shared_memory.SharedMemory(create=True, size=numPackets * 8)
+    try:
+        with ProcessPoolExecutor(numWorkers, mp_context=_poolContext()) as pool:
+            sums = list(pool.map(_segmentBlockSums,
+                                 *zip(*[(sampleSegment, s, e, blockSize) for s, e in segments])))
+
+            # Wait of the packet right before each segment
+            prevWaits = [0.0]
+            for lastSums, minSums in sums[:-1]:
+                prevWaits.append(lindleyCarry(lastSums, minSums, prevWaits[-1])[-1])
+
+            list(pool.map(_segmentWaits,
+                          *zip(*[(sampleSegment, waitShm.name, numPackets, s, e, w, blockSize)
+                                 for (s, e), w in zip(segments, prevWaits)])))
+
+        waitTimes = np.ndarray((numPackets,), dtype=np.float64, buffer=waitShm.buf).copy()
+        waitTimes[0] = 0.0
+        return waitTimes
+    finally:
+        waitShm.close()
+        waitShm.unlink()
+
+
+def _toShared(values):
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[...] = values
+    return shm
+
+
+def parallelLindley(interArrivals, serviceTimes, numWorkers=None,
+                    blockSize=DEFAULT_BLOCK_SIZE):
+    '''
+    Computes the wait time of every packet using Lindley's equation, splitting
+    the path across a pool of worker processes.
+
+    interArrivals: Inter-arrival time of each packet
+    serviceTimes: Service time of each packet (array, or a scalar for a
+                  constant service time)
+    numWorkers: Number of worker processes (default: number of CPUs)
+
+    Returns a float64 array of wait times, one per packet.
+    '''
+    interArrivals = np.ascontiguousarray(interArrivals, dtype=np.float64)
+    numPackets = interArrivals.shape[0]
+    numWorkers = numWorkers or os.cpu_count() or 1
+
+    if numWorkers == 1:
+        return lindley(interArrivals, serviceTimes, blockSize=blockSize)
+
+    shms = [_toShared(interArrivals)]
+    if np.ndim(serviceTimes) == 0:
+        sampler = _SharedSampler(shms[0].name, None, float(serviceTimes), numPackets)
+    else:
+        shms.append(_toShared(np.ascontiguousarray(serviceTimes, dtype=np.float64)))
+        sampler = _SharedSampler(shms[0].name, shms[1].name, None, numPackets)
+
+    try:
+        return parallelLindleySampled(sampler, numPackets, numWorkers, blockSize)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,135 @@
+'''
+Runs many independent replications of a simulation in one process.
+
+Rather than re-running a main.py once per replication, an R x N block of
+random inputs is drawn and the recursion is run along axis 1 for all R
+replications at once. Each replication is reduced to a few summary
+statistics, and confidence intervals are computed across replications.
+
+Replications are processed in batches so that no input block holds more
+than maxElements values, which keeps memory bounded for large R x N.
+'''
+from collections import namedtuple
+from math import sqrt
+from statistics import NormalDist
+
+import numpy as np
+
+from .lindley import lindley
+from .tokenbucket import shaperDepartures, policerDrops
+
+DEFAULT_MAX_ELEMENTS = 2**23
+
+ConfidenceInterval = namedtuple('ConfidenceInterval', ['mean', 'halfWidth', 'low', 'high'])
+
+
+def confidenceInterval(samples, level=0.95):
+    '''
+    Normal-approximation confidence interval for the mean of independent
+    samples (one per replication).
+    '''
+    samples = np.asarray(samples, dtype=np.float64)
+    mean = samples.mean()
+    if samples.shape[0] < 2:
+        return ConfidenceInterval(mean, float('nan'), float('nan'), float('nan'))
+
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    halfWidth = z * samples.std(ddof=1) / sqrt(samples.shape[0])
+    return ConfidenceInterval(mean, halfWidth, mean - halfWidth, mean + halfWidth)
+
+
+def summarize(stats, level=0.95):
+    '''
+    Turns a dict of per-replication statistics into a dict of confidence
+    intervals, one per statistic.
+    '''
+    return {name: confidenceInterval(values, level) for name, values in stats.items()}
+
+
+def printSummary(summary, level=0.95):
+    for name, ci in summary.items():
+        print("\t- %s = %s +/- %s (%s%% CI)" % (name, ci.mean, ci.halfWidth, level * 100))
+
+
+def replicate(simulateBatch, numReplications, numPackets,
+              maxElements=DEFAULT_MAX_ELEMENTS):
+    '''
+    Runs numReplications replications, batch by batch.
+
+    simulateBatch: Function taking a replication count r and returning a dict
+                   of per-replication statistics (arrays of length r)
+
+    Returns a dict of arrays of length numReplications.
+    '''
+    batchSize = max(1, maxElements // max(numPackets, 1))
+    results = {}
+
+    done = 0
+    while done < numReplications:
+        r = min(batchSize, numReplications - done)
+        for name, values in simulateBatch(r).items():
+            results.setdefault(name, []).append(np.asarray(values))
+        done += r
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def waitStats(waitTimes):
+    '''
+    Per-replication (per-row) mean, max and 99th percentile of the wait times.
+    '''
+    return {
+        'meanWait': waitTimes.mean(axis=1),
+        'maxWait': waitTimes.max(axis=1),
+        'p99Wait': np.percentile(waitTimes, 99, axis=1),
+    }
+
+
+def replicateLindley(sampleBatch, numReplications, numPackets,
+                     maxElements=DEFAULT_MAX_ELEMENTS):
+    '''
+    Replicates a Lindley (Wait-Times) simulation.
+
+    sampleBatch: Function taking (r, n) and returning (interArrivals,
+                 serviceTimes) as r x n arrays (serviceTimes may be a scalar)
+    '''
+    def simulateBatch(r):
+        interArrivals, serviceTimes = sampleBatch(r, numPackets)
+        return waitStats(lindley(interArrivals, serviceTimes))
+
+    return replicate(simulateBatch, numReplications, numPackets, maxElements)
+
+
+def replicateShaper(sampleBatch, tokenRate, bucketSize, numReplications, numPackets,
+                    maxElements=DEFAULT_MAX_ELEMENTS, sampleLengths=None):
+    '''
+    Replicates the token bucket shaper w/ infinite queue.
+
+    sampleBatch: Function taking (r, n) and returning r x n inter-arrival times
+    sampleLengths: Byte mode: function taking (r, n) and returning r x n
+                   packet lengths
+    '''
+    def simulateBatch(r):
+        arrEmpEnv = np.cumsum(sampleBatch(r, numPackets), axis=1)
+        pktLengths = None if sampleLengths is None else sampleLengths(r, numPackets)
+        return waitStats(shaperDepartures(arrEmpEnv, tokenRate, bucketSize, pktLengths) - arrEmpEnv)
+
+    return replicate(simulateBatch, numReplications, numPackets, maxElements)
+
+
+def replicatePolicer(sampleBatch, tokenRate, bucketSize, numReplications, numPackets,
+                     initialTokens=0.0, maxElements=DEFAULT_MAX_ELEMENTS, sampleLengths=None):
+    '''
+    Replicates the token bucket policer w/ no queue.
+
+    sampleBatch: Function taking (r, n) and returning r x n inter-arrival times
+    sampleLengths: Byte mode: function taking (r, n) and returning r x n
+                   packet lengths
+    '''
+    def simulateBatch(r):
+        pktLengths = None if sampleLengths is None else sampleLengths(r, numPackets)
+        dropCount, _ = policerDrops(sampleBatch(r, numPackets), tokenRate, bucketSize, initialTokens,
+                                    pktLengths=pktLengths)
+        return {'dropCount': dropCount, 'dropRate': dropCount / float(numPackets)}
+
+    return replicate(simulateBatch, numReplications, numPackets, maxElements)
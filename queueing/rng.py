@@ -0,0 +1,165 @@
+'''
+Random number layer shared by all the demos.
+
+Every run is driven by one seed. A numpy SeedSequence built from that seed
+spawns independent child streams (e.g. one for inter-arrival times, one for
+service times / packet sizes), each feeding a numpy Generator (PCG64). The
+same seed therefore always reproduces the same run, bit for bit, and adding
+draws to one stream never shifts the numbers of another.
+
+Samples are written block by block into preallocated float64 buffers, so
+large draws don't need temporaries and stay cache friendly.
+
+Counter-based mode (CounterStreams / PacketSampler):
+    For chunked and parallel runs, each stream is a Philox generator whose
+    counter is tied to the packet index: packet i of a stream is always the
+    i-th 64-bit output of its Philox key. Exponentials are drawn by inverse
+    transform so every sample uses exactly one output, which lets any packet
+    range be generated directly by jumping the counter. A worker starting at
+    packet k * chunk produces exactly the numbers a serial run would have.
+'''
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 2**16
+
+# Child stream indices
+ARRIVALS = 0 # Inter-arrival times
+SERVICE = 1 # Service times / packet sizes
+NUM_STREAMS = 2
+FLOWS = 2 # Flow IDs (per-flow policer, which spawns FLOWS + 1 streams)
+
+
+def seedSequence(seed=None):
+    '''
+    Returns the SeedSequence for a run. With seed=None, fresh entropy is
+    drawn; its value (seedSequence(...).entropy) can be reused as the seed to
+    reproduce the run.
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def spawnGenerators(seed=None, numStreams=NUM_STREAMS):
+    '''
+    Returns numStreams independent PCG64 Generators spawned from seed.
+    '''
+    return [np.random.Generator(np.random.PCG64(child))
+            for child in seedSequence(seed).spawn(numStreams)]
+
+
+def exponential(gen, rate, size, out=None, blockSize=DEFAULT_BLOCK_SIZE):
+    '''
+    Draws exponential samples with the given rate (i.e. mean 1 / rate).
+
+    gen: numpy Generator to draw from
+    rate: Rate of the exponential distribution
+    size: Number of samples, or a shape tuple
+    out: Optional preallocated float64 array to fill
+
+    Returns the filled float64 array.
+    '''
+    out = np.empty(size) if out is None else out
+    flat = out.reshape(-1)
+    scale = 1.0 / rate
+
+    for start in range(0, flat.shape[0], blockSize):
+        block = flat[start:start + blockSize]
+        gen.standard_exponential(out=block)
+        block *= scale
+
+    return out
+
+
+def bernoulli(gen, p, size, blockSize=DEFAULT_BLOCK_SIZE):
+    '''
+    Draws Bernoulli trials with P(1) = p, e.g. to pick between two packet types.
+
+    Returns an array of 0/1 indices (numpy intp).
+    '''
+    out = np.empty(size, dtype=np.intp)
+    flat = out.reshape(-1)
+    uniforms = np.empty(min(blockSize, flat.shape[0]))
+
+    for start in range(0, flat.shape[0], blockSize):
+        block = flat[start:start + blockSize]
+        u = uniforms[:block.shape[0]]
+        gen.random(out=u)
+        np.less(u, p, out=block, casting='unsafe')
+
+    return out
+
+
+class CounterStreams(object):
+    '''
+    Counter-based (Philox) random streams, one key per stream, all derived
+    from a single seed. Any packet range of any stream can be generated
+    directly, without generating what comes before it.
+    '''
+    def __init__(self, seed=None, numStreams=NUM_STREAMS):
+        self.keys = [child.generate_state(2, np.uint64)
+                     for child in seedSequence(seed).spawn(numStreams)]
+
+    def uniform(self, stream, start, count, out=None):
+        '''
+        Uniform [0, 1) samples for packets start..start+count-1 of a stream.
+        '''
+        # Each Philox counter value yields 4 outputs
+        gen = np.random.Generator(np.random.Philox(key=self.keys[stream], counter=start // 4))
+        if start % 4:
+            gen.random(start % 4)
+
+        out = np.empty(count) if out is None else out
+        gen.random(out=out)
+        return out
+
+    def exponential(self, stream, rate, start, count, out=None):
+        '''
+        Exponential samples for packets start..start+count-1 of a stream.
+        '''
+        # Inverse transform: -log(1 - U) / rate
+        out = self.uniform(stream, start, count, out)
+        np.negative(out, out=out)
+        np.log1p(out, out=out)
+        out *= -1.0 / rate
+        return out
+
+    def bernoulli(self, stream, p, start, count):
+        '''
+        0/1 indices (P(1) = p) for packets start..start+count-1 of a stream.
+        '''
+        return (self.uniform(stream, start, count) < p).astype(np.intp)
+
+
+class PacketSampler(object):
+    '''
+    Generates the (interArrivals, serviceTimes) of any packet range
+    [start, end) from CounterStreams. Picklable, so worker processes can
+    generate their own segments (see parallel.parallelLindleySampled).
+
+    arrRate: Poisson arrival rate
+    servRate: Rate of exponential service times (M/M/1)
+    serviceTimes: Constant service time (M/D/1), or a list of service times
+                  per packet type, picked with P(type 1) = typeProbability
+    '''
+    def __init__(self, streams, arrRate, servRate=None, serviceTimes=None,
+                 typeProbability=None):
+        self.streams = streams
+        self.arrRate = arrRate
+        self.servRate = servRate
+        self.serviceTimes = serviceTimes
+        self.typeProbability = typeProbability
+
+    def __call__(self, start, end):
+        n = end - start
+        interArrivals = self.streams.exponential(ARRIVALS, self.arrRate, start, n)
+
+        if self.servRate is not None:
+            serviceTimes = self.streams.exponential(SERVICE, self.servRate, start, n)
+        elif self.typeProbability is not None:
+            packetSizeIndex = self.streams.bernoulli(SERVICE, self.typeProbability, start, n)
+            serviceTimes = np.take(self.serviceTimes, packetSizeIndex)
+        else:
+            serviceTimes = self.serviceTimes
+
+        return interArrivals, serviceTimes
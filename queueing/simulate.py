@@ -0,0 +1,300 @@
+'''
+Programmatic API for the demos.
+
+Each simulate* function runs one model from its parameters and a seed and
+returns NumPy arrays (in a namedtuple), without printing or plotting, so the
+models can be called from sweeps, tests or notebooks. The demo scripts and
+the command line interface (python -m queueing, see __main__.py) are thin
+layers over these functions, and the same seed gives the same arrays in all
+three.
+
+Derived quantities come from the other modules, e.g.
+    arrEmpEnv = np.cumsum(run.interArrivals)
+    pktInSys = backlogSeries(arrEmpEnv, arrEmpEnv + run.waitTimes, times)
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from .parallel import parallelLindley, parallelLindleySampled
+from .rng import spawnGenerators, exponential, bernoulli, \
+                 CounterStreams, PacketSampler, ARRIVALS, SERVICE, FLOWS
+from .tokenbucket import shaperDepartures, policerDrops
+from .gcra import gcraArrivals, gcraShaperDepartures, gcraPolicerDrops, streamGcraShaper, \
+                  streamGcraPolicer, NS_PER_SECOND, DEFAULT_CHUNK_SIZE
+from .marker import srtcmColors, trtcmColors
+from .flowpolicer import FlowPolicer, streamFlowPolicer, flowSamples, FLOW_BLOCK_SIZE
+
+# waitTimes is the queueing delay (time until service starts) of each packet
+QueueRun = namedtuple('QueueRun', ['interArrivals', 'serviceTimes', 'waitTimes'])
+# pktLengths is the length of each packet in byte mode, None otherwise
+ShaperRun = namedtuple('ShaperRun', ['interArrivals', 'arrEmpEnv', 'departEmpEnv', 'pktLengths'])
+PolicerRun = namedtuple('PolicerRun', ['interArrivals', 'dropped', 'pktLengths'])
+# colors holds the GREEN / YELLOW / RED code of each packet (see marker.py)
+MarkerRun = namedtuple('MarkerRun', ['interArrivals', 'colors', 'pktLengths'])
+# Per-flow totals (one entry per flow); the byte counts are None outside byte mode
+FlowPolicerRun = namedtuple('FlowPolicerRun', ['packetCounts', 'dropCounts', 'byteCounts', 'droppedBytes'])
+
+# Token bucket engines: float seconds (tokenbucket.py) or integer nanoseconds (gcra.py)
+ENGINES = ('float', 'gcra')
+
+
+def _queueRun(numPackets, seed, numWorkers, counterRNG, arrRate, servRate=None,
+              serviceTimes=None, typeProbability=None):
+    '''
+    Runs Lindley's equation for one of the queue models. Service times are
+    exponential (servRate), constant (scalar serviceTimes) or one of
+    serviceTimes per packet type (P(type 1) = typeProbability).
+    '''
+    if counterRNG:
+        # Counter-based streams: the same seed gives identical waitTimes for any numWorkers
+        sampler = PacketSampler(CounterStreams(seed), arrRate, servRate=servRate,
+                                serviceTimes=serviceTimes, typeProbability=typeProbability)
+        waitTimes = parallelLindleySampled(sampler, numPackets, numWorkers)
+        interArrivals, pktServiceTimes = sampler(0, numPackets)
+    else:
+        gens = spawnGenerators(seed)
+        interArrivals = exponential(gens[ARRIVALS], arrRate, numPackets)
+        if servRate is not None:
+            pktServiceTimes = exponential(gens[SERVICE], servRate, numPackets)
+        elif typeProbability is not None:
+            pktServiceTimes = np.take(serviceTimes, bernoulli(gens[SERVICE], typeProbability, numPackets))
+        else:
+            pktServiceTimes = serviceTimes
+        waitTimes = parallelLindley(interArrivals, pktServiceTimes, numWorkers)
+
+    pktServiceTimes = np.broadcast_to(np.asarray(pktServiceTimes, dtype=np.float64), (numPackets,))
+    return QueueRun(interArrivals, np.array(pktServiceTimes), waitTimes)
+
+
+def simulateMM1(numPackets, arrRate, servRate, seed=None, numWorkers=1, counterRNG=False):
+    '''
+    Simulates an M/M/1 queue (see Wait-Times-MM1/main.py).
+
+    numPackets: Number of packets
+    arrRate, servRate: Arrival & service rate (per second)
+    seed: Integer seed or SeedSequence (random if None)
+    numWorkers: Number of processes to split the Lindley run across
+    counterRNG: Use counter-based (Philox) streams instead of PCG64
+
+    Returns a QueueRun of per-packet arrays.
+    '''
+    return _queueRun(numPackets, seed, numWorkers, counterRNG, arrRate, servRate=servRate)
+
+
+def simulateMD1(numPackets, arrRate, servRate, seed=None, numWorkers=1, counterRNG=False):
+    '''
+    Simulates an M/D/1 queue (constant service time 1 / servRate); see
+    simulateMM1 for the arguments.
+    '''
+    return _queueRun(numPackets, seed, numWorkers, counterRNG, arrRate,
+                     serviceTimes=1.0 / servRate)
+
+
+def multiplexerRates(packetLengths, packetDistribution, outgoingBW, rho):
+    '''
+    Service time of each packet type and the service & arrival rates of the
+    packet multiplexer.
+
+    packetLengths: Packet length of each type (Bytes)
+    packetDistribution: Proportion of packets of each type
+    outgoingBW: Outgoing link bandwidth (bits per second)
+    rho: System utilization
+
+    Returns (serviceTimes, servRate, arrRate).
+    '''
+    bits = np.multiply(packetLengths, 8.0)
+    serviceTimes = bits / outgoingBW
+    servRate = outgoingBW / np.dot(packetDistribution, bits) # Avg. packet tx rate (mu)
+    return serviceTimes, servRate, rho * servRate
+
+
+def simulateMultiplexer(numPackets, packetLengths, packetDistribution, outgoingBW, rho,
+                        seed=None, numWorkers=1, counterRNG=False):
+    '''
+    Simulates the two-type packet multiplexer, an M/G/1 queue (see
+    Wait-Times-Packet-Multiplexer/main.py and multiplexerRates for the
+    parameters, simulateMM1 for the rest).
+    '''
+    serviceTimes, _, arrRate = multiplexerRates(packetLengths, packetDistribution, outgoingBW, rho)
+    return _queueRun(numPackets, seed, numWorkers, counterRNG, arrRate,
+                     serviceTimes=serviceTimes, typeProbability=packetDistribution[1])
+
+
+def packetLengthSamples(gen, packetLengths, packetDistribution, size):
+    '''
+    Length of each packet, one of the two packetLengths with
+    P(packetLengths[1]) = packetDistribution[1] (as in the multiplexer).
+    '''
+    return np.take(np.asarray(packetLengths, dtype=np.float64), bernoulli(gen, packetDistribution[1], size))
+
+
+def _tokenBucketInputs(numPackets, arrRate, seed, packetLengths, packetDistribution, pktLengths):
+    '''
+    Inter-arrival times, plus the packet lengths in byte mode: pktLengths
+    as given (a trace, repeated if shorter than numPackets) or drawn from
+    the packetLengths / packetDistribution mix.
+    '''
+    gens = spawnGenerators(seed)
+    interArrivals = exponential(gens[ARRIVALS], arrRate, numPackets)
+    if pktLengths is not None:
+        pktLengths = np.resize(np.asarray(pktLengths, dtype=np.float64), numPackets)
+    elif packetLengths is not None:
+        pktLengths = packetLengthSamples(gens[SERVICE], packetLengths, packetDistribution, numPackets)
+    return interArrivals, pktLengths
+
+
+def _checkEngine(engine):
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine %r (expected one of %s)" % (engine, ', '.join(ENGINES)))
+
+
+def simulateTokenBucket(numPackets, arrRate, tokenRate, bucketSize, seed=None,
+                        packetLengths=None, packetDistribution=None, pktLengths=None, engine='float'):
+    '''
+    Simulates a token bucket shaper with an infinite queue, bucket initially
+    full (see Token-Bucket-Infinite-Queue/main.py).
+
+    packetLengths, packetDistribution: Packet length mix for byte mode, as
+                                       in simulateMultiplexer (tokenRate is
+                                       then in bytes per second, bucketSize
+                                       in bytes)
+    pktLengths: Or, the length of each packet (e.g. from a trace)
+    engine: 'float', or 'gcra' for the exact integer-nanosecond engine (the
+            times are then whole nanoseconds, returned in seconds)
+
+    Returns a ShaperRun with the arrival & departure time of each packet.
+    '''
+    _checkEngine(engine)
+    interArrivals, pktLengths = _tokenBucketInputs(numPackets, arrRate, seed, packetLengths,
+                                                   packetDistribution, pktLengths)
+    if engine == 'gcra':
+        arrivals = gcraArrivals(interArrivals)
+        departures, _ = gcraShaperDepartures(arrivals, tokenRate, bucketSize, pktLengths=pktLengths)
+        return ShaperRun(interArrivals, arrivals / NS_PER_SECOND, departures / NS_PER_SECOND, pktLengths)
+    arrEmpEnv = np.cumsum(interArrivals)
+    departEmpEnv = shaperDepartures(arrEmpEnv, tokenRate, bucketSize, pktLengths=pktLengths)
+    return ShaperRun(interArrivals, arrEmpEnv, departEmpEnv, pktLengths)
+
+
+def simulatePolicer(numPackets, arrRate, tokenRate, bucketSize, seed=None, initialTokens=0,
+                    packetLengths=None, packetDistribution=None, pktLengths=None, engine='float'):
+    '''
+    Simulates a token bucket policer with no queue (see
+    Token-Bucket-No-Queue/main.py); see simulateTokenBucket for byte mode
+    & the engine.
+
+    Returns a PolicerRun with a boolean array flagging each dropped packet.
+    '''
+    _checkEngine(engine)
+    interArrivals, pktLengths = _tokenBucketInputs(numPackets, arrRate, seed, packetLengths,
+                                                   packetDistribution, pktLengths)
+    if engine == 'gcra':
+        _, dropped, _ = gcraPolicerDrops(gcraArrivals(interArrivals), tokenRate, bucketSize,
+                                         initialTokens=initialTokens, pktLengths=pktLengths)
+    else:
+        _, dropped = policerDrops(interArrivals, tokenRate, bucketSize, initialTokens=initialTokens,
+                                  pktLengths=pktLengths)
+    return PolicerRun(interArrivals, dropped, pktLengths)
+
+
+def _tokenBucketChunks(arrRate, seed, packetLengths, packetDistribution, pktLengths):
+    '''
+    The streams of _tokenBucketInputs, drawn a chunk at a time (the same
+    seed gives the same packets): a function taking (offset, n) & returning
+    (interArrivals, pktLengths) for packets offset ... offset + n - 1.
+    '''
+    gens = spawnGenerators(seed)
+    if pktLengths is not None:
+        pktLengths = np.asarray(pktLengths, dtype=np.float64)
+
+    def sampleChunk(offset, n):
+        lengths = None
+        if pktLengths is not None:
+            lengths = np.take(pktLengths, np.arange(offset, offset + n), mode='wrap')
+        elif packetLengths is not None:
+            lengths = packetLengthSamples(gens[SERVICE], packetLengths, packetDistribution, n)
+        return exponential(gens[ARRIVALS], arrRate, n), lengths
+
+    return sampleChunk
+
+
+def streamTokenBucket(numPackets, arrRate, tokenRate, bucketSize, seed=None, packetLengths=None,
+                      packetDistribution=None, pktLengths=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Runs simulateTokenBucket with the GCRA engine over numPackets packets,
+    chunkSize at a time, in constant memory (e.g. for 10^9 packets). The same
+    seed gives the same packets as simulateTokenBucket.
+
+    Returns a dict of exact totals (times in ns, see gcra.streamGcraShaper).
+    '''
+    sampleChunk = _tokenBucketChunks(arrRate, seed, packetLengths, packetDistribution, pktLengths)
+    return streamGcraShaper(sampleChunk, numPackets, tokenRate, bucketSize, chunkSize)
+
+
+def streamPolicer(numPackets, arrRate, tokenRate, bucketSize, seed=None, initialTokens=0, packetLengths=None,
+                  packetDistribution=None, pktLengths=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Runs simulatePolicer with the GCRA engine over numPackets packets,
+    chunkSize at a time, in constant memory (see streamTokenBucket).
+
+    Returns a dict of exact totals (see gcra.streamGcraPolicer).
+    '''
+    sampleChunk = _tokenBucketChunks(arrRate, seed, packetLengths, packetDistribution, pktLengths)
+    return streamGcraPolicer(sampleChunk, numPackets, tokenRate, bucketSize, initialTokens, chunkSize)
+
+
+def simulateMarker(numPackets, arrRate, cir, cbs, ebs=None, pir=None, pbs=None, seed=None,
+                   packetLengths=None, packetDistribution=None, pktLengths=None):
+    '''
+    Simulates a three color marker (see Token-Bucket-Three-Color-Marker/main.py):
+    a trTCM if the peak rate pir (& burst size pbs) is given, otherwise an
+    srTCM with excess burst size ebs. See simulateTokenBucket for byte mode.
+
+    Returns a MarkerRun with the color of each packet.
+    '''
+    if pir is None and ebs is None:
+        raise ValueError("Give ebs (srTCM) or pir & pbs (trTCM)")
+    interArrivals, pktLengths = _tokenBucketInputs(numPackets, arrRate, seed, packetLengths,
+                                                   packetDistribution, pktLengths)
+    if pir is None:
+        colors = srtcmColors(interArrivals, cir, cbs, ebs, pktLengths=pktLengths)
+    else:
+        colors = trtcmColors(interArrivals, cir, cbs, pir, pbs, pktLengths=pktLengths)
+    return MarkerRun(interArrivals, colors, pktLengths)
+
+
+def simulateFlowPolicer(numPackets, arrRate, numFlows, tokenRate, bucketSize, seed=None, zipfExponent=0.0,
+                        initialTokens=0, packetLengths=None, packetDistribution=None, pktLengths=None,
+                        blockSize=FLOW_BLOCK_SIZE):
+    '''
+    Simulates a table of token bucket policers, one per flow, over one
+    interleaved stream (see the per-flow mode of Token-Bucket-No-Queue/main.py).
+    Packets arrive at arrRate in total and each one belongs to a random flow
+    (see flowpolicer.flowSamples). The stream is generated & policed
+    blockSize packets at a time, so memory doesn't grow with numPackets.
+
+    tokenRate, bucketSize: Of each flow's bucket (scalars, or one per flow)
+    See simulateTokenBucket for byte mode.
+
+    Returns a FlowPolicerRun with the packet & drop counts of each flow.
+    '''
+    gens = spawnGenerators(seed, FLOWS + 1)
+    numFlows = int(numFlows)
+    if pktLengths is not None:
+        pktLengths = np.asarray(pktLengths, dtype=np.float64)
+
+    def sampleBlock(offset, n):
+        lengths = None
+        if pktLengths is not None:
+            lengths = np.take(pktLengths, np.arange(offset, offset + n), mode='wrap')
+        elif packetLengths is not None:
+            lengths = packetLengthSamples(gens[SERVICE], packetLengths, packetDistribution, n)
+        return (exponential(gens[ARRIVALS], arrRate, n),
+                flowSamples(gens[FLOWS], numFlows, n, zipfExponent), lengths)
+
+    policer = streamFlowPolicer(sampleBlock, numPackets, FlowPolicer(numFlows, tokenRate, bucketSize, initialTokens),
+                                blockSize)
+    if pktLengths is None and packetLengths is None:
+        return FlowPolicerRun(policer.packetCounts, policer.dropCounts, None, None)
+    return FlowPolicerRun(policer.packetCounts, policer.dropCounts, policer.byteCounts, policer.droppedBytes)
@@ -0,0 +1,146 @@
+'''
+Constant-memory streaming mode for very long Lindley runs.
+
+Instead of building the inputs and waitTimes for every packet up front, the
+run is split into fixed-size chunks. Each chunk is generated, pushed through
+the Lindley engine and handed to a set of accumulators, after which it is
+discarded. Between chunks only the last wait time, the last service time and
+the running clock (arrival time of the last packet) are carried over, so peak
+memory depends on chunkSize rather than on numPackets.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from .lindley import lindley, lindleyContinue
+
+DEFAULT_CHUNK_SIZE = 2**20
+
+# One chunk of a streamed run, as seen by the accumulators
+# offset: Index of the first packet of the chunk within the whole run
+# arrivalTimes: Absolute arrival time of each packet (i.e. the arrival envelope)
+# departureTimes: arrivalTimes + waitTimes
+LindleyChunk = namedtuple('LindleyChunk',
+                          ['offset', 'interArrivals', 'serviceTimes',
+                           'arrivalTimes', 'waitTimes', 'departureTimes'])
+
+
+def streamLindley(sampleChunk, numPackets, accumulators=(),
+                  chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Runs Lindley's recursion over numPackets packets, chunkSize at a time.
+
+    sampleChunk: Function taking a packet count n and returning a tuple
+                 (interArrivals, serviceTimes) of length-n arrays (serviceTimes
+                 may also be a scalar for a constant service time)
+    numPackets: Total number of packets to simulate
+    accumulators: Objects with an update(chunk) method; each receives every
+                  LindleyChunk in order
+    chunkSize: Number of packets generated and simulated per chunk
+
+    Returns the accumulators (for convenience).
+    '''
+    lastWait = 0.0
+    lastService = None
+    clock = 0.0
+    waitBuf = np.empty(min(chunkSize, numPackets))
+
+    offset = 0
+    while offset < numPackets:
+        n = min(chunkSize, numPackets - offset)
+        interArrivals, serviceTimes = sampleChunk(n)
+        interArrivals = np.asarray(interArrivals, dtype=np.float64)
+        serviceTimes = np.broadcast_to(np.asarray(serviceTimes, dtype=np.float64), (n,))
+
+        # First packet of the run starts with an empty queue; every later chunk
+        # continues from where the previous one left off
+        if lastService is None:
+            waitTimes = lindley(interArrivals, serviceTimes, out=waitBuf[:n])
+        else:
+            waitTimes = lindleyContinue(interArrivals, serviceTimes, lastWait, lastService,
+                                        out=waitBuf[:n])
+
+        arrivalTimes = np.cumsum(interArrivals)
+        arrivalTimes += clock
+        departureTimes = arrivalTimes + waitTimes
+
+        chunk = LindleyChunk(offset, interArrivals, serviceTimes,
+                             arrivalTimes, waitTimes, departureTimes)
+        for acc in accumulators:
+            acc.update(chunk)
+
+        lastWait = waitTimes[-1]
+        lastService = serviceTimes[-1]
+        clock = arrivalTimes[-1]
+        offset += n
+
+    return accumulators
+
+
+class WaitStats(object):
+    '''
+    Running count, mean, variance, min and max of the wait times.
+    Chunks are merged with Chan et al.'s pairwise update, which stays accurate
+    over billions of packets.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared deviations from the mean
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, chunk):
+        values = chunk.waitTimes
+        n = values.shape[0]
+        if n == 0:
+            return
+
+        chunkMean = values.mean()
+        chunkM2 = np.square(values - chunkMean).sum()
+
+        total = self.count + n
+        delta = chunkMean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunkM2 + delta**2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class WaitHistogram(object):
+    '''
+    Fixed-width histogram of the wait times. Bins are added on demand as
+    longer waits show up, so the range does not need to be known up front.
+    Memory is proportional to max wait / binWidth.
+    '''
+    def __init__(self, binWidth):
+        self.binWidth = float(binWidth)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, chunk):
+        bins = (chunk.waitTimes / self.binWidth).astype(np.int64)
+        chunkCounts = np.bincount(bins)
+        if chunkCounts.shape[0] > self.counts.shape[0]:
+            self.counts = np.pad(self.counts, (0, chunkCounts.shape[0] - self.counts.shape[0]))
+        self.counts[:chunkCounts.shape[0]] += chunkCounts
+
+    def cdf(self):
+        '''
+        Returns (x, F) where F[i] is the fraction of packets that waited at
+        most x[i] (the right edge of bin i).
+        '''
+        x = np.arange(1, self.counts.shape[0] + 1) * self.binWidth
+        return x, np.cumsum(self.counts) / max(self.counts.sum(), 1)
+
+    def quantile(self, q):
+        '''
+        Returns the smallest bin edge below which at least a fraction q of
+        the wait times fall.
+        '''
+        x, F = self.cdf()
+        return x[min(np.searchsorted(F, q), x.shape[0] - 1)]
@@ -0,0 +1,46 @@
+'''
+Sweeps many load levels from a single set of random numbers.
+
+An exponential inter-arrival time with rate arrRate is a unit-rate
+exponential divided by arrRate. So one array of unit exponentials (and one
+array of service times) serves every point of a sweep: row k of the 2-D
+input block is unitInterArrivals / arrRates[k], and Lindley's recursion runs
+along axis 1 for all loads at once. Random numbers are generated once per
+sweep, and since every load sees the same random numbers (common random
+numbers), differences between load levels are much less noisy.
+'''
+import numpy as np
+
+from .lindley import lindley
+from .replications import DEFAULT_MAX_ELEMENTS, waitStats
+
+
+def sweepLindley(unitInterArrivals, serviceTimes, arrRates,
+                 maxElements=DEFAULT_MAX_ELEMENTS):
+    '''
+    Runs Lindley's equation once per arrival rate, reusing the same random
+    numbers for every rate.
+
+    unitInterArrivals: Inter-arrival times drawn at rate 1 (one per packet)
+    serviceTimes: Service time of each packet (array, or a scalar for a
+                  constant service time); shared by every load level
+    arrRates: Arrival rate of each sweep point
+
+    Returns a dict of arrays (see replications.waitStats) with one entry per
+    arrival rate.
+    '''
+    unitInterArrivals = np.asarray(unitInterArrivals, dtype=np.float64)
+    arrRates = np.asarray(arrRates, dtype=np.float64)
+    numPackets = unitInterArrivals.shape[0]
+
+    # Process as many load levels per pass as fit in maxElements
+    batchSize = max(1, maxElements // max(numPackets, 1))
+    results = {}
+
+    for start in range(0, arrRates.shape[0], batchSize):
+        rates = arrRates[start:start + batchSize]
+        interArrivals = unitInterArrivals / rates[:, np.newaxis]
+        for name, values in waitStats(lindley(interArrivals, serviceTimes)).items():
+            results.setdefault(name, []).append(values)
+
+    return {name: np.concatenate(values) for name, values in results.items()}
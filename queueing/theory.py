@@ -0,0 +1,488 @@
+'''
+Queueing theory shared by the demos: mean, variance, CDF and quantiles of the
+waiting time (queueing delay) of M/M/1, M/D/1 and M/G/1 systems.
+
+Means & variances are plain NumPy expressions, so they broadcast over arrays
+of rates like ufuncs. CDFs & quantiles are memoized per parameter tuple (with
+array arguments keyed by their contents) in LRU caches, so repeated calls
+from sweeps return the stored, read-only result.
+
+Moments (Pollaczek-Khinchine):
+    E[W] = lambda * E[S^2] / (2 * (1 - rho))
+    Var[W] = E[W]^2 + lambda * E[S^3] / (3 * (1 - rho))
+
+M/M/1:
+    F(t) = 1 - rho * exp(-(servRate - arrRate) * t)
+
+M/D/1:
+    Erlang's formula for the waiting time CDF,
+        F(t) = (1 - rho) * sum_{j=0..floor(t / D)} (lambda (jD - t))^j / j! * exp(-lambda (jD - t)),
+    alternates in sign and its terms grow like exp(lambda * t), so in floating
+    point it cancels catastrophically once t is a few dozen service times.
+    Instead, write t = (k + y) * D with 0 <= y < 1. F satisfies the delay
+    differential equation F'(t) = lambda * (F(t) - F(t - D)), whose solution on
+    each interval is the positive sum
+        F(t) = sum_{j=0..k} q(k - j) * Poisson(j; rho * (1 - y))
+    with q(n) = F((n + 1) * D) = P(N <= n + 1), N being the number in system.
+    The complement 1 - F(t) has the same form with q replaced by
+    P(N > n + 1) plus the Poisson tail P(Poisson(rho * (1 - y)) > k), so the
+    tail is accurate to full relative precision as well.
+
+    P(N = n) comes from the level-crossing balance of the embedded M/D/1
+    chain, pi(n) * a(0) = pi(0) * abar(n - 1) + sum_{i=1..n-1} pi(i) * abar(n - i),
+    where a(j) is the Poisson(rho) pmf and abar(j) its tail. Unlike the usual
+    recursion for the embedded chain, every term is positive, so relative
+    errors do not grow with n.
+
+M/G/1 (Pollaczek-Khinchine):
+    The waiting time is a geometric sum W = R(1) + ... + R(K), with
+    P(K = k) = (1 - rho) * rho^k and R(i) i.i.d. residual service times with
+    CDF E[min(S, x)] / E[S]; in transform terms W*(z) = (1 - rho) / (1 - rho * R*(z)).
+    For a discrete (or tabulated) service distribution, R is discretized on a
+    lattice of the grid step, once with each cell's mass at its left edge and
+    once at its right edge. Those stochastically bracket W, so inverting both
+    transforms by FFT gives a lower & upper bound on the CDF at every grid
+    point. The FFT length is chosen from Lundberg's bound P(W > t) <= exp(-eta * t),
+    where rho * E[exp(eta * R)] = 1, so that the wrap-around (aliasing) error
+    is below a given tolerance.
+'''
+from functools import lru_cache, wraps
+
+import numpy as np
+
+DEFAULT_TOLERANCE = 2.0**-60 # Absolute truncation error of the CDF (~1e-18)
+DEFAULT_CACHE_SIZE = 32
+MAX_CACHED_ELEMENTS = 2**16 # Larger array arguments (e.g. every sample of a run) bypass the cache
+DEFAULT_GRID_SIZE = 2**16 # Grid steps for the M/G/1 transform inversion
+
+
+class _ArrayKey(object):
+    '''
+    Hashable stand-in for an array argument, compared by contents.
+    '''
+    __slots__ = ('array', '_data', '_hash')
+
+    def __init__(self, array):
+        self.array = np.ascontiguousarray(array)
+        self._data = (self.array.shape, self.array.dtype.str, self.array.tobytes())
+        self._hash = hash(self._data)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, _ArrayKey) and self._data == other._data
+
+
+def _readOnly(result):
+    if isinstance(result, np.ndarray):
+        if result.ndim == 0:
+            return result[()]
+        result.flags.writeable = False
+    elif isinstance(result, tuple):
+        return tuple(_readOnly(r) for r in result)
+    return result
+
+
+def memoize(func):
+    '''
+    LRU-caches func per argument tuple. Array and list arguments are keyed by
+    their contents; array results are returned read-only (0-d as scalars).
+    Calls with an array argument over MAX_CACHED_ELEMENTS are not cached.
+    '''
+    def toKey(arg):
+        if isinstance(arg, (np.ndarray, list)):
+            return _ArrayKey(np.asarray(arg))
+        return arg
+
+    @lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+    def cached(*args, **kwargs):
+        args = [arg.array if isinstance(arg, _ArrayKey) else arg for arg in args]
+        kwargs = dict((k, v.array if isinstance(v, _ArrayKey) else v) for k, v in kwargs.items())
+        return _readOnly(func(*args, **kwargs))
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if any(np.size(arg) > MAX_CACHED_ELEMENTS for arg in list(args) + list(kwargs.values())
+               if isinstance(arg, (np.ndarray, list))):
+            return _readOnly(func(*args, **kwargs))
+        return cached(*[toKey(arg) for arg in args], **dict((k, toKey(v)) for k, v in kwargs.items()))
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+def _utilization(arrRate, meanService, model):
+    rho = np.multiply(arrRate, meanService)
+    if not np.all((rho > 0) & (rho < 1)):
+        raise ValueError("%s waiting times are only stable for 0 < rho < 1 (got %s)" % (model, rho))
+    return rho
+
+
+def pkMoments(arrRate, serviceMoments, model='M/G/1'):
+    '''
+    Mean & variance of the M/G/1 waiting time (Pollaczek-Khinchine).
+
+    arrRate: Packet arrival rate (broadcasts)
+    serviceMoments: (E[S], E[S^2], E[S^3]) of the service time (broadcast)
+
+    Returns (mean, variance).
+    '''
+    m1, m2, m3 = serviceMoments
+    rho = _utilization(arrRate, m1, model)
+    mean = np.multiply(arrRate, m2) / (2 * (1 - rho))
+    variance = np.square(mean) + np.multiply(arrRate, m3) / (3 * (1 - rho))
+    return mean, variance
+
+
+def _expMoments(servRate):
+    servTime = np.divide(1.0, servRate)
+    return servTime, 2 * servTime**2, 6 * servTime**3
+
+
+def _constMoments(servRate):
+    servTime = np.divide(1.0, servRate)
+    return servTime, servTime**2, servTime**3
+
+
+def _discreteMoments(serviceTimes, serviceProbs):
+    serviceTimes, serviceProbs = _serviceDistribution(serviceTimes, serviceProbs)
+    return tuple(np.dot(serviceProbs, serviceTimes**k) for k in (1, 2, 3))
+
+
+def _serviceDistribution(serviceTimes, serviceProbs):
+    '''
+    Sorted service times & normalized probabilities (equally likely if None).
+    '''
+    serviceTimes = np.asarray(serviceTimes, dtype=np.float64).reshape(-1)
+    if serviceProbs is None:
+        serviceProbs = np.full(serviceTimes.shape, 1.0 / len(serviceTimes))
+    serviceProbs = np.asarray(serviceProbs, dtype=np.float64).reshape(-1)
+    order = np.argsort(serviceTimes)
+    return serviceTimes[order], serviceProbs[order] / serviceProbs.sum()
+
+
+def mm1WaitMean(arrRate, servRate):
+    '''Mean M/M/1 waiting time, rho / (servRate - arrRate) (broadcasts).'''
+    return pkMoments(arrRate, _expMoments(servRate), 'M/M/1')[0]
+
+
+def mm1WaitVariance(arrRate, servRate):
+    '''M/M/1 waiting time variance, rho * (2 - rho) / (servRate - arrRate)^2 (broadcasts).'''
+    return pkMoments(arrRate, _expMoments(servRate), 'M/M/1')[1]
+
+
+@memoize
+def mm1WaitCdf(times, arrRate, servRate):
+    '''
+    M/M/1 waiting time CDF, 1 - rho * exp(-(servRate - arrRate) * t) for t >= 0
+    (broadcasts over times & rates).
+    '''
+    rho = _utilization(arrRate, np.divide(1.0, servRate), 'M/M/1')
+    times = np.asarray(times, dtype=np.float64)
+    cdf = 1 - rho * np.exp(-np.subtract(servRate, arrRate) * np.maximum(times, 0))
+    return np.where(times < 0, 0.0, cdf)
+
+
+@memoize
+def mm1WaitQuantile(probs, arrRate, servRate):
+    '''
+    M/M/1 waiting time quantiles: 0 up to the atom P(W = 0) = 1 - rho, then
+    log(rho / (1 - p)) / (servRate - arrRate) (broadcasts).
+    '''
+    rho = _utilization(arrRate, np.divide(1.0, servRate), 'M/M/1')
+    probs = np.asarray(probs, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        quantiles = np.log(rho / (1 - probs)) / np.subtract(servRate, arrRate)
+    return np.maximum(quantiles, 0.0)
+
+
+def poissonPmf(mean, tol=0.0):
+    '''
+    Poisson(mean) pmf from j = 0 up to the first term below tol (or until it
+    underflows when tol is 0), by the recurrence p(j) = p(j - 1) * mean / j.
+    '''
+    probs = [np.exp(-mean)]
+    j = 1
+    while True:
+        p = probs[-1] * mean / j
+        if p == 0 or (p < tol and j > mean):
+            break
+        probs.append(p)
+        j += 1
+    return np.array(probs)
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def md1Occupancy(rho, numLevels):
+    '''
+    Stationary distribution of the number of packets in an M/D/1 system.
+
+    rho: Utilization (arrival rate / service rate), 0 < rho < 1
+    numLevels: Number of states to compute
+
+    Returns read-only arrays (probs, tails), with probs[n] = P(N = n) and
+    tails[n] = P(N > n) for n < numLevels. The tail beyond the last state is
+    extrapolated geometrically from the last two states.
+    '''
+    a = poissonPmf(rho)
+    abar = np.cumsum(a[::-1])[::-1][1:] # abar[m] = P(Poisson(rho) > m), summed from the small end
+    abarRev = abar[::-1] # Last entry is abar[0]
+    window = len(abar)
+
+    probs = np.zeros(numLevels)
+    probs[0] = 1 - rho
+    for n in range(1, numLevels):
+        # pi(n) * a(0) = pi(0) * abar(n - 1) + sum_{i=1..n-1} pi(i) * abar(n - i)
+        start = max(1, n - window + 1)
+        total = np.dot(probs[start:n], abarRev[window - (n - start) - 1:window - 1])
+        if n - 1 < window:
+            total += probs[0] * abar[n - 1]
+        probs[n] = total / a[0]
+        if probs[n] == 0:
+            break # Underflow; the rest is below the smallest float
+
+    # P(N > n), summed from the small end, plus the geometric remainder
+    last = numLevels - 1
+    remainder = 0.0
+    if numLevels > 1 and probs[last] > 0:
+        ratio = probs[last] / probs[last - 1]
+        remainder = probs[last] * ratio / (1 - ratio)
+    tails = np.empty(numLevels)
+    tails[:-1] = np.cumsum(probs[:0:-1])[::-1]
+    tails[-1] = 0.0
+    tails += remainder
+
+    probs.flags.writeable = False
+    tails.flags.writeable = False
+    return probs, tails
+
+
+def md1WaitMean(arrRate, servRate):
+    '''Mean M/D/1 waiting time, rho / (2 * servRate * (1 - rho)) (broadcasts).'''
+    return pkMoments(arrRate, _constMoments(servRate), 'M/D/1')[0]
+
+
+def md1WaitVariance(arrRate, servRate):
+    '''M/D/1 waiting time variance (broadcasts).'''
+    return pkMoments(arrRate, _constMoments(servRate), 'M/D/1')[1]
+
+
+def _md1Cdf(x, rho, complement, tol):
+    '''
+    M/D/1 waiting time CDF (or its complement) at times x, in units of the
+    service time.
+    '''
+    result = np.full(x.shape, float(complement))
+    valid = x >= 0
+    if not np.any(valid):
+        return result
+
+    levels = np.floor(x[valid]).astype(np.int64)
+    means = rho * (1 - (x[valid] - levels)) # Poisson mean for each point, in (0, rho]
+
+    # q(n) = P(N <= n + 1) or its complement, rounded up in size for cache reuse
+    numLevels = 1 << max(6, int(levels.max() + 3).bit_length())
+    tails = md1Occupancy(rho, numLevels)[1][1:]
+    weights = tails if complement else 1 - tails
+
+    total = np.zeros(levels.shape)
+    pj = np.exp(-means)
+    # Terms beyond where the largest pmf drops under tol (or underflows for
+    # the complement, whose relative accuracy matters) are negligible
+    numTerms = len(poissonPmf(rho, 0.0 if complement else tol))
+    for j in range(numTerms):
+        inRange = levels >= j
+        total += np.where(inRange, weights[np.maximum(levels - j, 0)], float(complement)) * pj
+        pj = pj * means / (j + 1)
+
+    result[valid] = total
+    return result
+
+
+@memoize
+def md1WaitCdf(times, arrRate, servRate, complement=False, tol=DEFAULT_TOLERANCE):
+    '''
+    Waiting time (queueing delay) CDF of an M/D/1 system.
+
+    times: Times to evaluate the CDF at (scalar or array)
+    arrRate: Packet arrival rate
+    servRate: Constant service rate (service time = 1 / servRate)
+    complement: Return P(W > t) instead, accurate in the far tail
+    tol: Absolute truncation error allowed in the CDF
+
+    Results are cached per (times, rates); the returned array is read-only.
+    '''
+    rho = float(_utilization(arrRate, 1.0 / servRate, 'M/D/1'))
+    x = np.multiply(times, float(servRate), dtype=np.float64)
+    return _md1Cdf(x.reshape(-1), rho, complement, tol).reshape(x.shape)
+
+
+@memoize
+def md1WaitQuantile(probs, arrRate, servRate, tol=DEFAULT_TOLERANCE):
+    '''
+    M/D/1 waiting time quantiles (smallest t with F(t) >= p), to within a
+    relative tolerance of ~1e-15.
+
+    probs: Probabilities (scalar or array)
+    arrRate: Packet arrival rate
+    servRate: Constant service rate (service time = 1 / servRate)
+    '''
+    rho = float(_utilization(arrRate, 1.0 / servRate, 'M/D/1'))
+    probs = np.asarray(probs, dtype=np.float64)
+    flat = probs.reshape(-1)
+    result = np.zeros(flat.shape)
+    result[flat >= 1] = np.inf
+    search = np.flatnonzero((flat > 1 - rho) & (flat < 1))
+    if search.shape[0] == 0:
+        return result.reshape(probs.shape)
+
+    # F(n * D) = P(N <= n), so the occupancy tails bracket every quantile in a
+    # single service time: F((k - 1) * D) < p <= F(k * D)
+    numLevels = 64
+    while 1 - md1Occupancy(rho, numLevels)[1][-2] < flat[search].max():
+        numLevels *= 2
+    levelCdf = 1 - md1Occupancy(rho, numLevels)[1]
+    upper = np.searchsorted(levelCdf, flat[search], side='left').astype(np.float64)
+    low, high = upper - 1, upper
+
+    # Bisect within the bracket (the CDF is continuous & increasing for t > 0)
+    for _ in range(60):
+        mid = 0.5 * (low + high)
+        below = _md1Cdf(mid, rho, False, tol) < flat[search]
+        low = np.where(below, mid, low)
+        high = np.where(below, high, mid)
+
+    result[search] = high / servRate
+    return result.reshape(probs.shape)
+
+
+def _lundbergExponent(rho, latticeProbs, step):
+    '''
+    Solves rho * sum_j latticeProbs[j] * exp(eta * j * step) = 1 for eta > 0 by
+    bisection (in log space, to avoid overflow).
+    '''
+    support = np.flatnonzero(latticeProbs)
+    logProbs = np.log(latticeProbs[support]) + np.log(rho)
+    offsets = support * step
+
+    def excess(eta):
+        terms = logProbs + eta * offsets
+        peak = terms.max()
+        return peak + np.log(np.sum(np.exp(terms - peak))) # log(rho * E[exp(eta * R)])
+
+    low, high = 0.0, 1.0 / offsets.max()
+    while excess(high) < 0:
+        low, high = high, 2 * high
+    for _ in range(100):
+        mid = 0.5 * (low + high)
+        if excess(mid) < 0:
+            low = mid
+        else:
+            high = mid
+    return low # Lower root estimate keeps the bound conservative
+
+
+def mg1WaitMean(arrRate, serviceTimes, serviceProbs=None):
+    '''Mean M/G/1 waiting time for a discrete service distribution (broadcasts over arrRate).'''
+    return pkMoments(arrRate, _discreteMoments(serviceTimes, serviceProbs))[0]
+
+
+def mg1WaitVariance(arrRate, serviceTimes, serviceProbs=None):
+    '''M/G/1 waiting time variance for a discrete service distribution (broadcasts over arrRate).'''
+    return pkMoments(arrRate, _discreteMoments(serviceTimes, serviceProbs))[1]
+
+
+@memoize
+def mg1WaitCdf(arrRate, serviceTimes, serviceProbs=None, maxTime=None, step=None,
+               tol=DEFAULT_TOLERANCE**0.5):
+    '''
+    Waiting time (queueing delay) CDF of an M/G/1 system with a discrete
+    service time distribution, from the Pollaczek-Khinchine formula.
+
+    arrRate: Packet arrival rate
+    serviceTimes: Possible service times (or a table of sampled service times)
+    serviceProbs: Probability of each service time (equally likely if None)
+    maxTime: Last grid point (default: 99.99th percentile by Lundberg's bound)
+    step: Grid step (default: maxTime / DEFAULT_GRID_SIZE)
+    tol: Allowed aliasing error of the FFT inversion
+
+    Returns (times, cdf, errorBound): the CDF on the grid 0, step, 2 * step, ...
+    (midway between the lower & upper bounds) and the largest distance to
+    either bound. Results are cached per argument tuple and read-only.
+    '''
+    serviceTimes, serviceProbs = _serviceDistribution(serviceTimes, serviceProbs)
+    meanService = np.dot(serviceProbs, serviceTimes)
+    rho = float(_utilization(arrRate, meanService, 'M/G/1'))
+
+    if step is None:
+        if maxTime is None:
+            # Rough first pass on a coarse lattice, only to pick the time range
+            coarse = serviceTimes[-1] / 64
+            edges = np.arange(65) * coarse
+            cells = np.diff(_residualCdf(edges, serviceTimes, serviceProbs, meanService))
+            maxTime = np.log(1e4) / _lundbergExponent(rho, np.append(0.0, cells), coarse)
+        step = maxTime / DEFAULT_GRID_SIZE
+    if maxTime is None:
+        maxTime = DEFAULT_GRID_SIZE * step
+    numPoints = int(np.floor(maxTime / step + 1e-9)) + 1
+
+    # Residual service time R on the lattice: cell j = [j * step, (j + 1) * step)
+    numCells = int(np.ceil(serviceTimes[-1] / step - 1e-9))
+    edges = np.arange(numCells + 1) * step
+    cells = np.diff(_residualCdf(edges, serviceTimes, serviceProbs, meanService))
+    lowLattice = np.append(cells, 0.0) # Mass at left edges: W_low <= W
+    highLattice = np.append(0.0, cells) # Mass at right edges: W_high >= W
+
+    # Lundberg's bound on the mass beyond the FFT length (wrap-around error)
+    eta = _lundbergExponent(rho, highLattice, step)
+    fftLength = numPoints + max(numCells, int(np.ceil(np.log(1.0 / tol) / (eta * step))))
+    fftLength = 1 << int(fftLength - 1).bit_length()
+
+    bounds = []
+    for lattice in (lowLattice, highLattice):
+        transform = (1 - rho) / (1 - rho * np.fft.rfft(lattice, fftLength))
+        probs = np.fft.irfft(transform, fftLength)[:numPoints]
+        cdf = np.minimum(np.maximum.accumulate(np.cumsum(probs)), 1.0)
+        bounds.append(cdf)
+    upper, lower = bounds
+
+    times = np.arange(numPoints) * step
+    return times, 0.5 * (upper + lower), 0.5 * (upper - lower).max() + tol
+
+
+def _residualCdf(x, serviceTimes, serviceProbs, meanService):
+    '''
+    CDF of the residual (equilibrium) service time, E[min(S, x)] / E[S], for
+    sorted discrete service times.
+    '''
+    below = np.searchsorted(serviceTimes, x, side='right')
+    partialMeans = np.append(0.0, np.cumsum(serviceProbs * serviceTimes)) # E[S; S <= s_i]
+    partialProbs = np.append(0.0, np.cumsum(serviceProbs))
+    return (partialMeans[below] + x * (1 - partialProbs[below])) / meanService
+
+
+@memoize
+def mg1WaitQuantile(probs, arrRate, serviceTimes, serviceProbs=None):
+    '''
+    M/G/1 waiting time quantiles for a discrete service distribution,
+    interpolated on the mg1WaitCdf grid (accurate to about one grid step).
+
+    probs: Probabilities (scalar or array)
+    arrRate: Packet arrival rate
+    serviceTimes, serviceProbs: Service time distribution (see mg1WaitCdf)
+    '''
+    serviceTimes, serviceProbs = _serviceDistribution(serviceTimes, serviceProbs)
+    rho = float(_utilization(arrRate, np.dot(serviceProbs, serviceTimes), 'M/G/1'))
+    probs = np.asarray(probs, dtype=np.float64)
+
+    # Widen the grid until it covers the largest finite quantile asked for
+    target = probs[probs < 1].max(initial=0.0)
+    times, cdf, _ = mg1WaitCdf(arrRate, serviceTimes, serviceProbs)
+    while cdf[-1] < target:
+        times, cdf, _ = mg1WaitCdf(arrRate, serviceTimes, serviceProbs, maxTime=2 * times[-1])
+
+    quantiles = np.interp(probs, cdf, times)
+    quantiles = np.where(probs <= 1 - rho, 0.0, quantiles)
+    return np.where(probs >= 1, np.inf, quantiles)
@@ -0,0 +1,435 @@
+'''
+Vectorized engines for the token bucket demos.
+
+Shaper (infinite queue):
+    A greedy (bucketSize, tokenRate) shaper releases packets as soon as a token
+    is available. Its output is the min-plus convolution of the arrival
+    envelope with the token bucket curve bucketSize + tokenRate * t, which for
+    packet i (0-indexed) works out to
+        D(i) = max( A(i), max_{k <= i} ( A(k) + (i - k + 1 - bucketSize) / tokenRate ) )
+             = max( A(i), (i + 1 - bucketSize) / tokenRate + max_{k <= i} ( A(k) - k / tokenRate ) )
+    The inner term is a prefix maximum, so all departure times come out of a
+    handful of NumPy passes. The bucket is assumed full when the first packet
+    arrives (i.e. the first bucketSize packets of a burst pass immediately).
+
+Byte mode:
+    Real shapers & policers count bytes: packet i needs L(i) tokens (its
+    length) rather than 1, with tokenRate in bytes per second and bucketSize
+    in bytes (>= the longest packet). With C(i) = L(0) + ... + L(i), the
+    shaper's (i - k + 1) tokens for packets k..i become C(i) - C(k - 1):
+        D(i) = max( A(i), (C(i) - bucketSize) / tokenRate + max_{k <= i} ( A(k) - C(k - 1) / tokenRate ) )
+    still a prefix maximum, and the policer compares & subtracts L(i)
+    instead of 1. Both engines take the lengths as an optional pktLengths
+    array and are otherwise unchanged.
+    The policer's speed depends on how often the bucket fills (see below):
+    ~12-14 Mpkt/s for buckets of a few packets, or with a token rate well
+    above the byte rate, but ~3 Mpkt/s for a CIR just below the byte rate
+    with a CBS of 100s of packets (e.g. 394100 B/s & 150 KB, or 380000 B/s &
+    1.5 MB, against the 40 / 1500 byte mix at 350 packets/s, ~397 KB/s).
+
+Policer (no queue):
+    Each packet applies numTokens -> min(numTokens + tokenRate * dt, bucketSize)
+    followed by "take a token if there is one, otherwise drop". The drop branch
+    makes the per-packet map discontinuous, so composing maps does not stay in
+    a fixed-size family and a plain associative scan does not apply. Instead
+    the packets are cut into blocks that are all simulated in lockstep (one
+    NumPy operation per packet position covers every block), each block
+    starting from a guessed token count. Block start states are then corrected
+    from the previous block's end state and only the blocks whose start
+    changed are re-run. Block 0 is always right. Two runs from different
+    starts only merge once the bucket fills up (an empty bucket keeps their
+    fractional token counts apart), so this converges in a pass or two when
+    the bucket fills often (small buckets, token rate near or below the
+    arrival rate) and not at all when it rarely does. After MAX_FIXUP_PASSES
+    the remaining blocks are therefore finished by a sequential sweep, which
+    carries the corrected state through them in order with a plain Python
+    loop over the packets, skipping every block whose start turns out right.
+    The worst case is thus about the sequential loop's speed (~3 Mpkt/s),
+    the best ~20 Mpkt/s. Every packet goes through exactly the same float
+    operations as the sequential loop, so the result is bit-for-bit
+    identical to it.
+    The block driver (_blockedScan, _scanBlocks) takes any per-packet
+    recursion and is shared with the three color markers (see marker.py),
+    the per-flow policer (see flowpolicer.py) and the integer GCRA policer
+    (see gcra.py, an exact alternative to both engines here).
+
+Policer drop-rate surface:
+    Sizing a policer needs the drop rate of every (tokenRate, bucketSize)
+    pair. All pairs are run against one shared trace at once: the bucket
+    states are one array with an entry per pair, and the loop is over packets
+    only (same float operations as above, so each pair's count equals that of
+    policerDrops). The pairs are independent, so they can also be split
+    across worker processes.
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .parallel import _poolContext
+
+# Packets whose pass flags are buffered before they're added up (surface engine)
+SURFACE_BLOCK_SIZE = 256
+# Lockstep re-runs of the stale blocks before the blocked scan falls back to a sequential sweep
+MAX_FIXUP_PASSES = 2
+
+
+def shaperDepartures(arrEmpEnv, tokenRate, bucketSize, pktLengths=None):
+    '''
+    Computes the departure time of every packet from a token bucket shaper
+    with an infinite queue (each token = 1 packet).
+
+    arrEmpEnv: Sorted arrival time of each packet (arrival empirical envelope).
+               A 2-D (R x N) array is treated as R independent traces.
+    tokenRate: Token generation rate (per second)
+    bucketSize: Max tokens in bucket (>= 1)
+    pktLengths: Length of each packet, for byte mode (tokenRate in bytes per
+                second, bucketSize in bytes >= the longest packet)
+
+    Returns a float64 array of departure times (departure empirical envelope).
+    '''
+    arrEmpEnv = np.asarray(arrEmpEnv, dtype=np.float64)
+    if pktLengths is not None:
+        return _byteShaperDepartures(arrEmpEnv, tokenRate, bucketSize, pktLengths)
+    tokenTimes = np.arange(arrEmpEnv.shape[-1], dtype=np.float64)
+    tokenTimes /= tokenRate # k / tokenRate
+
+    # Prefix max of A(k) - k / tokenRate
+    departEmpEnv = np.subtract(arrEmpEnv, tokenTimes)
+    np.maximum.accumulate(departEmpEnv, axis=-1, out=departEmpEnv)
+
+    # + (i + 1 - bucketSize) / tokenRate, then never before the packet arrives
+    departEmpEnv += tokenTimes
+    departEmpEnv += (1 - bucketSize) / float(tokenRate)
+    np.maximum(departEmpEnv, arrEmpEnv, out=departEmpEnv)
+
+    return departEmpEnv
+
+
+def _byteShaperDepartures(arrEmpEnv, tokenRate, bucketSize, pktLengths):
+    pktLengths = np.broadcast_to(np.asarray(pktLengths, dtype=np.float64), arrEmpEnv.shape)
+    if pktLengths.size and pktLengths.max() > bucketSize:
+        raise ValueError("bucketSize (%s bytes) is smaller than the longest packet (%s bytes)"
+                         % (bucketSize, pktLengths.max()))
+    byteTimes = np.cumsum(pktLengths, axis=-1)
+    byteTimes /= tokenRate # C(i) / tokenRate
+
+    # Prefix max of A(k) - C(k - 1) / tokenRate
+    departEmpEnv = np.subtract(arrEmpEnv, byteTimes)
+    departEmpEnv += pktLengths / tokenRate
+    np.maximum.accumulate(departEmpEnv, axis=-1, out=departEmpEnv)
+
+    # + (C(i) - bucketSize) / tokenRate, then never before the packet arrives
+    departEmpEnv += byteTimes
+    departEmpEnv -= bucketSize / float(tokenRate)
+    np.maximum(departEmpEnv, arrEmpEnv, out=departEmpEnv)
+
+    return departEmpEnv
+
+
+def _policerLockstep(steps, startTokens, bucketSize, costs=None):
+    '''
+    Runs independent policers side by side, one per column of steps.
+
+    steps: (numSteps x K) array of tokens generated before each packet
+    startTokens: Tokens in each of the K buckets before the first packet
+    costs: (numSteps x K) array of tokens each packet needs (default: 1)
+
+    Returns (dropped, endTokens): a (numSteps x K) boolean array of drops and
+    the tokens left in each bucket after the last packet.
+    '''
+    numTokens = np.array(startTokens, dtype=np.float64)
+    passed = np.empty(numTokens.shape, dtype=bool)
+    dropped = np.empty(steps.shape, dtype=bool)
+
+    for j in range(steps.shape[0]):
+        cost = 1 if costs is None else costs[j]
+        np.add(numTokens, steps[j], out=numTokens)
+        np.minimum(numTokens, bucketSize, out=numTokens)
+        np.greater_equal(numTokens, cost, out=passed)
+        np.subtract(numTokens, cost, out=numTokens, where=passed)
+        np.logical_not(passed, out=dropped[j])
+
+    return dropped, numTokens
+
+
+def _policerSequential(steps, startTokens, bucketSize, costs=None):
+    '''
+    One policer over one block, as a plain loop (same float operations as
+    _policerLockstep). Returns (dropped, endTokens).
+    '''
+    numTokens = float(startTokens)
+    bucketSize = float(bucketSize)
+    costs = [1.0] * len(steps) if costs is None else costs.tolist()
+    dropped = []
+
+    for step, cost in zip(steps.tolist(), costs):
+        numTokens += step
+        if numTokens > bucketSize:
+            numTokens = bucketSize
+        if numTokens >= cost:
+            numTokens -= cost
+            dropped.append(False)
+        else:
+            dropped.append(True)
+
+    return dropped, numTokens
+
+
+def _scanBlocks(lockstep, inputs, startStates, follows, dtype=bool, sequential=None):
+    '''
+    Runs blocks of packets side by side, re-running blocks until their start
+    states are consistent (see the module docstring).
+
+    lockstep: Function taking (blockInputs, startStates) and returning
+              (outputs, endStates), for the blocks selected from inputs and
+              startStates (states are lists of arrays, one per variable)
+    inputs: List of (blockSize x K) arrays of per-packet inputs, one column
+            per block, or K-arrays of per-block ones (None entries are
+            passed through)
+    startStates: List of K-arrays, the state of each block before its first
+                 packet; blocks that don't follow another one keep theirs,
+                 the others are a first guess (updated in place)
+    follows: Indices of the blocks that carry on from the block before them
+    sequential: Function taking (blockInputs, startStates) for a single
+                block (a column or scalar per input, a scalar per state
+                variable) and returning (outputs, endStates) as a plain loop,
+                for the sequential sweep (default: lockstep on that block)
+
+    Returns (outputs, endStates): the (blockSize x K) outputs, and the state
+    after each block's last packet.
+    '''
+    numBlocks = startStates[0].shape[0]
+    outputs = np.empty(inputs[0].shape, dtype=dtype)
+    endStates = [np.empty_like(start) for start in startStates]
+    active = np.arange(numBlocks)
+
+    for _ in range(MAX_FIXUP_PASSES + 1):
+        if active.shape[0] < numBlocks:
+            blockInputs = [None if values is None else values[..., active] for values in inputs]
+        else:
+            blockInputs = inputs
+        outputs[:, active], blockEnds = lockstep(blockInputs, [start[active] for start in startStates])
+        for end, blockEnd in zip(endStates, blockEnds):
+            end[active] = blockEnd
+
+        # Re-run every block whose start state turned out to be wrong
+        stale = np.zeros(follows.shape[0], dtype=bool)
+        for start, end in zip(startStates, endStates):
+            stale |= start[follows] != end[follows - 1]
+        changed = follows[stale]
+        for start, end in zip(startStates, endStates):
+            start[changed] = end[changed - 1]
+        active = changed
+        if active.shape[0] == 0:
+            return outputs, endStates
+
+    # Sequential sweep: blocks before the first stale one of each chain are right, so
+    # walking the blocks in order, each block's start is final once the block before
+    # it is done. Only blocks whose start differs from what they were run with are re-run.
+    if sequential is None:
+        def sequential(blockInputs, blockStarts):
+            blockInputs = [None if values is None else np.asarray(values)[..., np.newaxis] for values in blockInputs]
+            blockOutputs, blockEnds = lockstep(blockInputs, [np.array([start]) for start in blockStarts])
+            return blockOutputs[:, 0], [end[0] for end in blockEnds]
+
+    rerun = np.zeros(numBlocks, dtype=bool)
+    rerun[active] = True
+    isFollow = np.zeros(numBlocks, dtype=bool)
+    isFollow[follows] = True
+    startLists = [start.tolist() for start in startStates]
+    endLists = [end.tolist() for end in endStates]
+    for block in range(int(active[0]), numBlocks):
+        if not isFollow[block]:
+            continue
+        blockStarts = [end[block - 1] for end in endLists]
+        if not rerun[block] and blockStarts == [start[block] for start in startLists]:
+            continue
+        blockOutputs, blockEnds = sequential([None if values is None else values[..., block] for values in inputs],
+                                             blockStarts)
+        outputs[:, block] = blockOutputs
+        for start, end, blockStart, blockEnd in zip(startLists, endLists, blockStarts, blockEnds):
+            start[block] = blockStart
+            end[block] = blockEnd
+
+    for start, end, startList, endList in zip(startStates, endStates, startLists, endLists):
+        start[:] = startList
+        end[:] = endList
+    return outputs, endStates
+
+
+def _blockedScan(lockstep, inputs, initialState, blockSize=None, dtype=bool, returnStates=False,
+                 sequential=None):
+    '''
+    Runs a per-packet recursion (e.g. a policer) over R independent traces,
+    cut into blocks that are scanned in lockstep (see _scanBlocks).
+
+    lockstep: Function taking (blockInputs, startStates) and returning
+              (outputs, endStates), where blockInputs holds the inputs laid
+              out as (numSteps x K) arrays (one column per block) and the
+              states are lists of K-arrays, one per state variable
+    inputs: List of (R x N) arrays of per-packet inputs (None entries are
+            passed through); R independent traces of N packets
+    initialState: State variables at time 0 (one scalar each, whose type is
+                  that of the state, e.g. a float)
+    blockSize: Number of packets per block (default: ~sqrt(N))
+    dtype: Type of the per-packet outputs
+    returnStates: Also return the state variables after each trace's last
+                  packet (a list of R-arrays)
+    sequential: Plain-loop version of lockstep for one block (see _scanBlocks)
+
+    Returns the (R x N) array of outputs (and the end states).
+    '''
+    numTraces, numPackets = inputs[0].shape
+    if blockSize is None:
+        blockSize = max(256, int(np.sqrt(numPackets)))
+    blockSize = min(blockSize, numPackets)
+    blocksPerTrace = -(-numPackets // blockSize)
+    numBlocks = numTraces * blocksPerTrace
+
+    # Lay packets out as (position in block, block) so each step reads a
+    # contiguous row. Padding at the end of each trace is never read back.
+    def layout(values):
+        blocks = np.zeros((numTraces, blocksPerTrace * blockSize), dtype=values.dtype)
+        blocks[:, :numPackets] = values
+        return blocks.reshape(numBlocks, blockSize).T.copy()
+
+    # The first block of each trace starts from initialState; all others
+    # follow on from the block before them
+    follows = np.ones(numBlocks, dtype=bool)
+    follows[::blocksPerTrace] = False
+    follows = np.flatnonzero(follows)
+
+    inputs = [None if values is None else layout(values) for values in inputs]
+    startStates = [np.full(numBlocks, value) for value in initialState]
+    outputs, endStates = _scanBlocks(lockstep, inputs, startStates, follows, dtype, sequential)
+    outputs = outputs.T.reshape(numTraces, -1)[:, :numPackets]
+    if not returnStates:
+        return outputs
+
+    # The padding at the end of each trace moves the end state of its last
+    # block, so the real packets of those blocks are run once more on their own
+    lastBlocks = np.arange(blocksPerTrace - 1, numBlocks, blocksPerTrace)
+    numLast = numPackets - (blocksPerTrace - 1) * blockSize
+    if numLast == blockSize:
+        return outputs, [end[lastBlocks] for end in endStates]
+    _, finalStates = lockstep([None if values is None else values[:numLast, lastBlocks] for values in inputs],
+                              [start[lastBlocks] for start in startStates])
+    return outputs, list(finalStates)
+
+
+def policerDrops(interArrivals, tokenRate, bucketSize, initialTokens=0.0,
+                 blockSize=None, pktLengths=None):
+    '''
+    Simulates a token bucket policer with no queue (each token = 1 packet).
+
+    interArrivals: Inter-arrival time of each packet (the first one is
+                   measured from time 0, when the bucket holds initialTokens).
+                   A 2-D (R x N) array is treated as R independent traces.
+    tokenRate: Token generation rate (per second)
+    bucketSize: Max tokens in bucket
+    initialTokens: Tokens in bucket at time 0
+    blockSize: Number of packets per block (default: ~sqrt(numPackets))
+    pktLengths: Length of each packet, for byte mode (tokenRate in bytes per
+                second, bucketSize & initialTokens in bytes)
+
+    Returns (dropCount, dropped) where dropped is a boolean array flagging
+    each dropped packet. For 2-D input, dropCount is an array with one count
+    per trace.
+    '''
+    newTokens = np.multiply(tokenRate, np.asarray(interArrivals, dtype=np.float64))
+    numPackets = newTokens.shape[-1]
+    traces = newTokens.reshape(-1, numPackets)
+    numTraces = traces.shape[0]
+
+    if numPackets == 0:
+        dropped = np.zeros(newTokens.shape, dtype=bool)
+        return (0 if newTokens.ndim == 1 else np.zeros(numTraces, dtype=np.int64)), dropped
+
+    costs = None
+    if pktLengths is not None:
+        costs = np.broadcast_to(np.asarray(pktLengths, dtype=np.float64), newTokens.shape).reshape(-1, numPackets)
+
+    def lockstep(blockInputs, startStates):
+        dropped, endTokens = _policerLockstep(blockInputs[0], startStates[0], bucketSize, blockInputs[1])
+        return dropped, [endTokens]
+
+    def sequential(blockInputs, startStates):
+        dropped, endTokens = _policerSequential(blockInputs[0], startStates[0], bucketSize, blockInputs[1])
+        return dropped, [endTokens]
+
+    dropped = _blockedScan(lockstep, [traces, costs], [float(initialTokens)], blockSize,
+                           sequential=sequential).reshape(newTokens.shape)
+    if newTokens.ndim == 1:
+        return int(np.count_nonzero(dropped)), dropped
+    return np.count_nonzero(dropped, axis=-1), dropped
+
+
+def _policerSurfaceCounts(interArrivals, tokenRates, bucketSizes, initialTokens, pktLengths=None,
+                          blockSize=SURFACE_BLOCK_SIZE):
+    '''
+    Drop count of each (tokenRates[k], bucketSizes[k]) policer over the same
+    inter-arrival times, simulated side by side.
+    '''
+    numPackets = interArrivals.shape[0]
+    numTokens = np.full(tokenRates.shape, float(initialTokens))
+    newTokens = np.empty(tokenRates.shape)
+    passed = np.empty((blockSize,) + tokenRates.shape, dtype=bool)
+    passCount = np.zeros(tokenRates.shape, dtype=np.int64)
+
+    for start in range(0, numPackets, blockSize):
+        block = interArrivals[start:start + blockSize]
+        costs = None if pktLengths is None else pktLengths[start:start + blockSize].tolist()
+        for j, interArrival in enumerate(block.tolist()):
+            passing = passed[j]
+            np.multiply(tokenRates, interArrival, out=newTokens)
+            np.add(numTokens, newTokens, out=numTokens)
+            np.minimum(numTokens, bucketSizes, out=numTokens)
+            if costs is None:
+                np.greater_equal(numTokens, 1, out=passing)
+                np.subtract(numTokens, passing, out=numTokens) # - 1 where passed, exactly
+            else:
+                np.greater_equal(numTokens, costs[j], out=passing)
+                np.subtract(numTokens, costs[j], out=numTokens, where=passing)
+        passCount += np.count_nonzero(passed[:block.shape[0]], axis=0)
+
+    return numPackets - passCount
+
+
+def policerDropSurface(interArrivals, tokenRates, bucketSizes, initialTokens=0.0,
+                       numWorkers=1, pktLengths=None):
+    '''
+    Drop count of a token bucket policer with no queue for every pair of
+    token rate and bucket size, from one shared trace.
+
+    interArrivals: Inter-arrival time of each packet (the first one is
+                   measured from time 0, when every bucket holds initialTokens)
+    tokenRates: Token generation rates (per second), R values
+    bucketSizes: Max tokens in bucket, B values
+    initialTokens: Tokens in bucket at time 0
+    numWorkers: Number of worker processes to split the pairs across
+                (None: number of CPUs)
+    pktLengths: Length of each packet, for byte mode (see policerDrops)
+
+    Returns an (R x B) int64 array: entry [i, j] is the number of packets
+    dropped with tokenRates[i] and bucketSizes[j]. Divide by the number of
+    packets for the drop-rate surface.
+    '''
+    interArrivals = np.ascontiguousarray(interArrivals, dtype=np.float64)
+    if pktLengths is not None:
+        pktLengths = np.broadcast_to(np.asarray(pktLengths, dtype=np.float64), interArrivals.shape)
+    rates, sizes = np.meshgrid(np.asarray(tokenRates, dtype=np.float64),
+                               np.asarray(bucketSizes, dtype=np.float64), indexing='ij')
+    shape = rates.shape
+    rates, sizes = rates.ravel(), sizes.ravel()
+
+    numWorkers = min(numWorkers or os.cpu_count() or 1, rates.shape[0])
+    if numWorkers <= 1:
+        return _policerSurfaceCounts(interArrivals, rates, sizes, initialTokens, pktLengths).reshape(shape)
+
+    parts = np.array_split(np.arange(rates.shape[0]), numWorkers)
+    with ProcessPoolExecutor(numWorkers, mp_context=_poolContext()) as pool:
+        counts = list(pool.map(_policerSurfaceCounts, [interArrivals] * numWorkers,
+                               [rates[part] for part in parts], [sizes[part] for part in parts],
+                               [initialTokens] * numWorkers, [pktLengths] * numWorkers))
+    return np.concatenate(counts).reshape(shape)